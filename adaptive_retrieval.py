@@ -0,0 +1,75 @@
+"""
+adaptive_retrieval.py - Choose how many chunks to keep per query from the similarity score distribution
+"""
+import metrics
+from session_manager import debug_log
+from context_packing import estimate_tokens, MAX_CONTEXT_TOKENS
+
+# Candidates fetched with scores before selection
+CANDIDATE_K = 12
+# Always keep at least this many chunks
+MIN_CHUNKS = 2
+# Thresholds on cosine similarity (the embeddings are unit vectors, see ai_models.EMBEDDING_ENCODE_KWARGS)
+# Drop candidates scoring this far below the best hit
+MAX_SCORE_DROP = 0.15
+# Stop at the first drop between consecutive scores larger than this
+MAX_SCORE_GAP = 0.08
+
+def cosine_from_distance(distance):
+    """Squared L2 distance between unit vectors (what every backend returns) -> cosine similarity"""
+    return 1.0 - distance / 2.0
+
+def select_chunks(scored_docs, token_budget=MAX_CONTEXT_TOKENS, min_chunks=MIN_CHUNKS,
+                  max_drop=MAX_SCORE_DROP, max_gap=MAX_SCORE_GAP):
+    """Keep the head of a (doc, score) list sorted best-first.
+
+    A narrow factual question usually has one or two hits well above the
+    rest, so the list is cut at the first large score gap. Broad questions
+    have a flat distribution and keep more chunks, up to the token budget.
+    """
+    if not scored_docs:
+        return []
+
+    top_score = scored_docs[0][1]
+    kept = []
+    used_tokens = 0
+    previous_score = top_score
+    for doc, score in scored_docs:
+        if len(kept) >= min_chunks:
+            if top_score - score > max_drop or previous_score - score > max_gap:
+                break
+        tokens = estimate_tokens(doc.page_content)
+        if kept and used_tokens + tokens > token_budget:
+            break
+        kept.append(doc)
+        used_tokens += tokens
+        previous_score = score
+    return kept
+
+def adaptive_search(db, query, candidate_k=CANDIDATE_K, token_budget=MAX_CONTEXT_TOKENS):
+    """Fetch scored candidates and keep a query-dependent number of them"""
+    scored_docs = [
+        (doc, cosine_from_distance(distance))
+        for doc, distance in db.similarity_search_with_score(query, k=candidate_k)
+    ]
+    return _keep_scored(scored_docs, token_budget)
+
+def adaptive_search_by_vector(db, query_vector, candidate_k=CANDIDATE_K, token_budget=MAX_CONTEXT_TOKENS):
+    """adaptive_search for an already embedded query"""
+    search = getattr(db, "similarity_search_by_vector_with_relevance_scores", None)
+    if search is None:
+        raise NotImplementedError("vector store has no scored search by vector")
+    # Despite the name, Chroma (and the NumPy stores, which copy its contract) return distances here
+    scored_docs = [(doc, cosine_from_distance(distance)) for doc, distance in search(query_vector, k=candidate_k)]
+    return _keep_scored(scored_docs, token_budget)
+
+def _keep_scored(scored_docs, token_budget):
+    scored_docs.sort(key=lambda pair: pair[1], reverse=True)
+    kept = select_chunks(scored_docs, token_budget=token_budget)
+
+    metrics.increment("retrieval.queries")
+    metrics.increment("retrieval.chunks_used", len(kept))
+    metrics.increment("retrieval.candidates", len(scored_docs))
+    scores = ", ".join(f"{score:.2f}" for _, score in scored_docs[:len(kept) + 1])
+    debug_log(f"Adaptive retrieval: kept {len(kept)}/{len(scored_docs)} chunks (scores: {scores})")
+    return kept
@@ -2,43 +2,96 @@
 ai_models.py - AI model loading and initialization
 """
 import streamlit as st
+import os
+import metrics
 from session_manager import debug_log
+from llm_client import ResilientLLM
 
-EMBEDDING_MODEL_NAME = "paraphrase-MiniLM-L3-v2" 
+EMBEDDING_MODEL_NAME = "paraphrase-MiniLM-L3-v2"
+# Unit-length embeddings, so squared L2 distances map straight to cosine similarity on every backend
+EMBEDDING_ENCODE_KWARGS = {"normalize_embeddings": True}
 LLM_MODEL_NAME = "gemini-1.5-flash"
+FAST_LLM_MODEL_NAME = os.getenv("FAST_LLM_MODEL_NAME", "gemini-1.5-flash-8b")
+
+# Per-task routing: which model answers each task, and with what budget.
+# Short classification/explanation prompts go to the fast model with tight limits; answers and
+# study notes are long structured text, so they are not capped (None = the model's own limit).
+TASK_ROUTES = {
+    "answer": {"model": LLM_MODEL_NAME, "temperature": 0.1, "max_output_tokens": None, "timeout": 45},
+    "prereq-detect": {"model": FAST_LLM_MODEL_NAME, "temperature": 0.0, "max_output_tokens": 24, "timeout": 8},
+    "prereq-explain": {"model": FAST_LLM_MODEL_NAME, "temperature": 0.2, "max_output_tokens": 400, "timeout": 20},
+    "notes": {"model": LLM_MODEL_NAME, "temperature": 0.2, "max_output_tokens": None, "timeout": 120},
+    "reformulate": {"model": FAST_LLM_MODEL_NAME, "temperature": 0.2, "max_output_tokens": 600, "timeout": 20},
+    "summary": {"model": FAST_LLM_MODEL_NAME, "temperature": 0.1, "max_output_tokens": 320, "timeout": 60},
+}
+DEFAULT_TASK = "answer"
+
+# LLM call policy (see llm_client.ResilientLLM)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Fire a duplicate request after this many seconds (unset = no hedging)
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS")) if os.getenv("LLM_HEDGE_AFTER_SECONDS") else None
 
 @st.cache_resource
 def load_embedding_model():
     """Load the embedding model"""
     debug_log("Loading embedding model...")
     from langchain_community.embeddings import SentenceTransformerEmbeddings
-    return SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    return SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs=EMBEDDING_ENCODE_KWARGS)
 
 @st.cache_resource
-def load_llm(google_api_key):
-    """Load the Google Gemini LLM"""
-    debug_log(f"Loading Google Gemini LLM: {LLM_MODEL_NAME}...")
+def load_llm(google_api_key, task=DEFAULT_TASK):
+    """Load the Google Gemini LLM routed for a task"""
+    route = TASK_ROUTES[task]
+    debug_log(f"Loading Google Gemini LLM for '{task}': {route['model']}...")
     try:
         from langchain_google_genai import ChatGoogleGenerativeAI
-        llm = ChatGoogleGenerativeAI(
-            model=LLM_MODEL_NAME, 
+        model = ChatGoogleGenerativeAI(
+            model=route["model"],
             google_api_key=google_api_key,
-            temperature=0.1, 
-            convert_system_message_to_human=True
+            temperature=route["temperature"],
+            max_output_tokens=route["max_output_tokens"],
+            convert_system_message_to_human=True,
+            max_retries=0  # retries are handled by ResilientLLM
         )
+        # Deadlines, retries, the process-wide concurrency cap and hedging
+        llm = ResilientLLM(
+            model,
+            name=route["model"],
+            task=task,
+            timeout=route["timeout"],
+            max_retries=LLM_MAX_RETRIES,
+            hedge_after=LLM_HEDGE_AFTER_SECONDS
+        )
+        metrics.set_gauge("llm.route", route["model"], task=task)
         debug_log("LLM Gemini loaded.")
         return llm
-    except Exception as e: 
+    except Exception as e:
         st.error(f"Error loading Gemini model: {e}")
         debug_log(f"Error loading LLM: {e}")
         st.stop()
 
+def get_task_llm(task):
+    """Return the routed LLM for a task, falling back to the default LLM"""
+    task_llms = st.session_state.get("task_llms") or {}
+    return task_llms.get(task) or st.session_state.llm
+
+def stream_llm_text(llm, prompt):
+    """Yield the text of an LLM response chunk by chunk (for st.write_stream)"""
+    for chunk in llm.stream(prompt):
+        text = getattr(chunk, "content", chunk)
+        if text:
+            yield text
+
 def initialize_ai_models(google_api_key):
     """Initialize AI models if not already loaded"""
     # Load LLM once per authenticated session
     if st.session_state.llm is None:
         st.session_state.llm = load_llm(google_api_key)
-        
+
+    # One routed LLM per task (cached process-wide by load_llm)
+    if not st.session_state.get("task_llms"):
+        st.session_state.task_llms = {task: load_llm(google_api_key, task) for task in TASK_ROUTES}
+
     # Load embedding model
     if st.session_state.embedding_model is None:
-        st.session_state.embedding_model = load_embedding_model()
\ No newline at end of file
+        st.session_state.embedding_model = load_embedding_model()
@@ -0,0 +1,90 @@
+"""
+ann_index.py - Approximate nearest-neighbour search (HNSW) over a mapped index, for whole-course libraries
+"""
+import os
+import threading
+import weakref
+import numpy as np
+from session_manager import debug_log
+from mapped_index import MappedVectorStore
+from vector_compression import normalize_rows
+
+# Graph degree: higher gives better recall, more memory and slower builds
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+# Candidate list size while building the graph
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+# Candidate list size per query: the recall/latency knob (never below k)
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+_open_lock = threading.Lock()
+_OPEN_GRAPHS = weakref.WeakValueDictionary()  # graph file -> SharedGraph, one copy per process
+
+def ann_available():
+    try:
+        import hnswlib  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def graph_path(index_dir, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION):
+    """The graph file lives next to the mapped index files, one per build setting"""
+    return os.path.join(index_dir, f"hnsw-m{m}-ef{ef_construction}.bin")
+
+class SharedGraph:
+    """An HNSW graph shared by every store on the same index in this process"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        # hnswlib's ef is a setting of the graph object, so it is set and used under one lock
+        self.lock = threading.Lock()
+
+def open_graph(index, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION):
+    """Load (building it first if needed) the HNSW graph of a mapped index"""
+    path = graph_path(index.path, m, ef_construction)
+    with _open_lock:
+        shared = _OPEN_GRAPHS.get(path)
+        if shared is None:
+            shared = SharedGraph(build_graph(index, m, ef_construction))
+            _OPEN_GRAPHS[path] = shared
+        return shared
+
+def build_graph(index, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION):
+    """Build (or load the saved) HNSW graph for a mapped index"""
+    import hnswlib
+    graph = hnswlib.Index(space="ip", dim=index.dimensions)
+    path = graph_path(index.path, m, ef_construction)
+    if os.path.exists(path):
+        graph.load_index(path, max_elements=max(1, index.count))
+        return graph
+
+    graph.init_index(max_elements=max(1, index.count), M=m, ef_construction=ef_construction)
+    if index.count:
+        graph.add_items(np.asarray(index.embeddings), np.arange(index.count))
+    # Written under a temporary name so a reader never loads a half-written graph
+    staging = f"{path}.tmp-{os.getpid()}"
+    graph.save_index(staging)
+    os.replace(staging, path)
+    debug_log(f"Built HNSW graph for {os.path.basename(index.path)} ({index.count} vectors)")
+    return graph
+
+class HnswVectorStore(MappedVectorStore):
+    """MappedVectorStore that finds candidates with an HNSW graph instead of scanning every row"""
+
+    def __init__(self, embedding, index, shared_graph, ef_search=HNSW_EF_SEARCH):
+        super().__init__(embedding, index)
+        self.shared_graph = shared_graph
+        self.ef_search = ef_search
+
+    def _top_k(self, query_vector, k):
+        if not self.index.count:
+            return []
+        k = min(k, self.index.count)
+        query = normalize_rows(query_vector)
+        with self.shared_graph.lock:
+            self.shared_graph.graph.set_ef(max(self.ef_search, k))
+            labels, distances = self.shared_graph.graph.knn_query(query, k=k)
+        # Inner-product space: distance = 1 - cosine similarity
+        return [(int(row), 1.0 - float(distance)) for row, distance in zip(labels[0], distances[0])]
+
+    def export(self):
+        return {"path": self.index.path, "ef_search": self.ef_search}
@@ -0,0 +1,75 @@
+"""
+batch_questions.py - Answer a pasted list of review questions in one go
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import metrics
+from session_manager import debug_log
+from scheduler import SchedulerBusyError, BUSY_MESSAGE
+
+# A message needs at least this many list items to be treated as a batch
+MIN_BATCH_QUESTIONS = 2
+# Questions answered from one message (the rest are left for a follow-up message)
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "30"))
+# Answers generated at once for one batch; the LLM scheduler still caps the global total
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# "1.", "2)", "Q3:", "-", "*", "a)" ...
+LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\(?\d{1,3}[.):]|q\d{1,3}[.):]?|\(?[a-z][.)])\s+", re.IGNORECASE)
+
+def split_questions(text):
+    """Return the questions of a pasted list, or None if the message is a single question"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < MIN_BATCH_QUESTIONS:
+        return None
+
+    questions = []
+    for line in lines:
+        marker = LIST_MARKER.match(line)
+        question = line[marker.end():].strip() if marker else line
+        # Every line must look like a list item or a question, otherwise it's prose
+        if not marker and not question.endswith("?"):
+            return None
+        if question:
+            questions.append(question)
+    return questions if len(questions) >= MIN_BATCH_QUESTIONS else None
+
+def answer_questions(rag_chain, questions, on_answer=None):
+    """Answer questions concurrently and return the answers in question order.
+
+    on_answer(index, answer) is called from the caller's thread as each answer
+    completes, so it may update Streamlit elements.
+    """
+    debug_log(f"Batch: retrieving for {len(questions)} questions")
+    source_docs = rag_chain.retrieve_many(questions)
+
+    answers = [None] * len(questions)
+    workers = max(1, min(BATCH_CONCURRENCY, len(questions)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-answer") as pool:
+        futures = {
+            pool.submit(rag_chain.answer_from_docs, question, docs): index
+            for index, (question, docs) in enumerate(zip(questions, source_docs))
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                answers[index] = future.result()
+            except SchedulerBusyError:
+                answers[index] = BUSY_MESSAGE
+            except Exception as e:
+                debug_log(f"Batch answer {index + 1} failed: {e}")
+                answers[index] = "Error processing this question."
+            if on_answer:
+                on_answer(index, answers[index])
+
+    metrics.increment("batch.messages")
+    metrics.increment("batch.questions", len(questions))
+    return answers
+
+def format_batch_answer(questions, answers):
+    """One chat message with every question and its answer"""
+    return "\n\n---\n\n".join(
+        f"**{number}. {question}**\n\n{answer}"
+        for number, (question, answer) in enumerate(zip(questions, answers), start=1)
+    )
@@ -0,0 +1,95 @@
+"""
+benchmark_ann.py - Recall and latency of the HNSW backend against exact search
+
+Usage: python benchmark_ann.py course1.pdf [course2.pdf ...]
+       python benchmark_ann.py --synthetic 200000
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from mapped_index import write_index, open_index, MappedVectorStore
+from ann_index import HnswVectorStore, SharedGraph, build_graph, graph_path, HNSW_M, HNSW_EF_CONSTRUCTION
+from vector_compression import normalize_rows
+
+QUERY_COUNT = 200
+QUERY_WORDS = 12
+RECALL_AT = 10
+EF_SEARCH_VALUES = (16, 32, 64, 128, 256)
+# Synthetic corpora: vectors drawn around this many topic centres
+SYNTHETIC_TOPICS = 500
+SYNTHETIC_DIMENSIONS = 384
+
+def pdf_corpus(pdf_paths):
+    """Chunk texts and query texts from PDFs, split the same way uploads are"""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150, add_start_index=True)
+    texts = []
+    for pdf_path in pdf_paths:
+        texts.extend(chunk.page_content for chunk in splitter.split_documents(PyPDFLoader(pdf_path).load()))
+    rng = random.Random(0)
+    queries = [" ".join(text.split()[:QUERY_WORDS]) for text in rng.sample(texts, min(QUERY_COUNT, len(texts)))]
+
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from ai_models import EMBEDDING_MODEL_NAME, EMBEDDING_ENCODE_KWARGS
+    embedding_model = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs=EMBEDDING_ENCODE_KWARGS)
+    return texts, embedding_model.embed_documents(texts), embedding_model.embed_documents(queries)
+
+def synthetic_corpus(count):
+    """Clustered random unit vectors; queries are perturbed corpus vectors"""
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(SYNTHETIC_TOPICS, SYNTHETIC_DIMENSIONS)).astype(np.float32)
+    vectors = centres[rng.integers(0, SYNTHETIC_TOPICS, count)]
+    vectors += 0.5 * rng.normal(size=vectors.shape).astype(np.float32)
+    queries = vectors[rng.choice(count, QUERY_COUNT, replace=False)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32)
+    return [f"chunk {i}" for i in range(count)], vectors, queries
+
+def timed_queries(store, queries, k):
+    results = []
+    started = time.perf_counter()
+    for query in queries:
+        results.append([row for row, _ in store._top_k(query, k)])
+    return results, (time.perf_counter() - started) / len(queries) * 1000
+
+def run(texts, vectors, queries):
+    workdir = tempfile.mkdtemp(prefix="ann-benchmark-")
+    try:
+        path = os.path.join(workdir, "corpus")
+        write_index(path, texts, [{} for _ in texts], vectors, "benchmark")
+        index = open_index(path)
+        queries = normalize_rows(queries)
+        print(f"{index.count} vectors x {index.dimensions} dimensions, {len(queries)} queries, recall@{RECALL_AT}")
+
+        exact, exact_ms = timed_queries(MappedVectorStore(None, index), queries, RECALL_AT)
+        print(f"{'exact (brute force)':<24}{'recall 1.000':>14}{exact_ms:>10.3f} ms/query")
+
+        started = time.perf_counter()
+        graph = SharedGraph(build_graph(index))
+        build_seconds = time.perf_counter() - started
+        graph_mb = os.path.getsize(graph_path(path)) / 1024 / 1024
+        print(f"HNSW M={HNSW_M} ef_construction={HNSW_EF_CONSTRUCTION}: built in {build_seconds:.1f}s, {graph_mb:.1f} MiB on disk")
+
+        for ef_search in EF_SEARCH_VALUES:
+            store = HnswVectorStore(None, index, graph, ef_search=ef_search)
+            found, ann_ms = timed_queries(store, queries, RECALL_AT)
+            recall = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(found, exact)])
+            print(f"{f'hnsw ef_search={ef_search}':<24}{f'recall {recall:.3f}':>14}{ann_ms:>10.3f} ms/query")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    if len(sys.argv) < 2:
+        print("\n".join(__doc__.strip().splitlines()[2:]))
+        sys.exit(1)
+    if sys.argv[1] == "--synthetic":
+        run(*synthetic_corpus(int(sys.argv[2]) if len(sys.argv) > 2 else 100000))
+    else:
+        run(*pdf_corpus(sys.argv[1:]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+benchmark_database.py - Latency of the conversation database calls, pooled connections versus connect-per-call
+
+Usage: python benchmark_database.py [iterations] [--conversations N]
+Runs against temporary database files; chatbot_data.db is never touched.
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import database_manager
+
+# Messages per benchmark conversation (a typical tutoring session)
+MESSAGE_COUNT = 20
+# Threads saving and loading at the same time, like concurrent Streamlit sessions
+CONCURRENT_THREADS = 4
+# Users sharing the listing benchmark's conversations
+LISTING_USERS = 200
+# Sidebar pages walked per listing sample ("Load more" clicked this many times minus one)
+LISTING_PAGES = 5
+
+def sample_messages(turns=MESSAGE_COUNT):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} about photosynthesis. " * 8}
+        for i in range(turns)
+    ]
+
+def legacy_call(fn):
+    """Run a call the way the module used to: schema check plus a fresh connection every time"""
+    def call(*args):
+        database_manager.close_connections()  # nothing idle to reuse
+        conn = sqlite3.connect(database_manager.DB_PATH)
+        database_manager._create_schema(conn)
+        conn.close()
+        return fn(*args)
+    return call
+
+def timed(fn, iterations, *args):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def summarize(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<40} p50 {statistics.median(samples):7.3f} ms   p95 {p95:7.3f} ms")
+
+def run_operations(label, wrap, iterations):
+    messages = sample_messages()
+    database_manager.create_user("bench", "secret", "bench@example.com")
+    conversation_id = database_manager.save_conversation("bench", "bench-1", "Benchmark", messages)
+    summarize(f"{label} authenticate_user", timed(wrap(database_manager.authenticate_user), iterations, "bench", "secret"))
+    summarize(f"{label} save_conversation", timed(wrap(database_manager.save_conversation), iterations,
+                                                 "bench", conversation_id, "Benchmark", messages))
+    summarize(f"{label} load_conversation", timed(wrap(database_manager.load_conversation), iterations,
+                                                 "bench", conversation_id))
+    summarize(f"{label} load_user_conversations", timed(wrap(database_manager.load_user_conversations), iterations,
+                                                       "bench"))
+
+def run_concurrent(iterations):
+    """Saves and loads from several threads at once; counts calls that failed on a locked database"""
+    messages = sample_messages()
+    samples, failures = [], []
+
+    def worker(n):
+        conversation_id = f"bench-thread-{n}"
+        for _ in range(iterations):
+            start = time.perf_counter()
+            if database_manager.save_conversation("bench", conversation_id, "Benchmark", messages) is None:
+                failures.append(conversation_id)
+            database_manager.load_conversation("bench", conversation_id)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(CONCURRENT_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summarize(f"{CONCURRENT_THREADS} threads save + load", samples)
+    print(f"{'failed saves':<40} {len(failures)}")
+
+def use_database(path):
+    database_manager.close_connections()
+    database_manager.DB_PATH = path
+    database_manager._schema_ready = False
+
+def fill_unmigrated(path, conversation_count):
+    """A database at schema version 0 (no indexes) holding conversation_count conversations"""
+    conn = sqlite3.connect(path)
+    database_manager._create_schema(conn)
+    conn.executemany(
+        "INSERT INTO conversations (conversation_id, username, title, last_updated, messages, document_name) "
+        "VALUES (?, ?, ?, ?, '[]', ?)",
+        ((f"conv-{i:07d}", f"user{i % LISTING_USERS}", f"Conversation {i}",
+          f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00", "course.pdf")
+         for i in range(conversation_count))
+    )
+    conn.commit()
+    conn.close()
+
+def list_pages(username):
+    cursor = None
+    for _ in range(LISTING_PAGES):
+        _, cursor = database_manager.list_conversations(username, after=cursor)
+        if cursor is None:
+            return
+
+def run_listing(iterations, conversation_count):
+    """Sidebar listing latency on a large table, before and after the schema migrations"""
+    print(f"{conversation_count} conversations across {LISTING_USERS} users, {LISTING_PAGES} sidebar pages\n")
+    usernames = [f"user{i % LISTING_USERS}" for i in range(iterations)]
+    
+    def sample():
+        samples = []
+        for username in usernames:
+            start = time.perf_counter()
+            list_pages(username)
+            samples.append((time.perf_counter() - start) * 1000)
+        return samples
+    
+    summarize(f"schema v{database_manager.schema_version()} list_conversations", sample())
+    start = time.perf_counter()
+    database_manager.apply_migrations()
+    print(f"{'migrations':<40} {time.perf_counter() - start:7.3f} s")
+    summarize(f"schema v{database_manager.schema_version()} list_conversations", sample())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversation database")
+    parser.add_argument("iterations", nargs="?", type=int, default=500)
+    parser.add_argument("--conversations", type=int, default=100000, help="rows in the listing benchmark")
+    args = parser.parse_args()
+    iterations = args.iterations
+    
+    with tempfile.TemporaryDirectory() as scratch:
+        use_database(os.path.join(scratch, "benchmark.db"))
+        print(f"{iterations} iterations, {MESSAGE_COUNT} messages per conversation\n")
+        run_operations("pooled", lambda fn: fn, iterations)
+        run_operations("connect-per-call", legacy_call, iterations)
+        print()
+        run_concurrent(iterations // CONCURRENT_THREADS)
+        print()
+        
+        listing_path = os.path.join(scratch, "listing.db")
+        fill_unmigrated(listing_path, args.conversations)
+        use_database(listing_path)
+        run_listing(iterations, args.conversations)
+        database_manager.close_connections()
+
+if __name__ == "__main__":
+    main()
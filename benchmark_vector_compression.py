@@ -0,0 +1,101 @@
+"""
+benchmark_vector_compression.py - Memory versus recall of the vector compression settings on sample PDFs
+
+Usage: python benchmark_vector_compression.py course1.pdf [course2.pdf ...]
+"""
+import random
+import sys
+import time
+import numpy as np
+from numpy_vector_store import NumpyVectorStore
+from vector_compression import normalize_rows
+
+# Queries sampled per document (the opening words of random chunks)
+QUERY_COUNT = 100
+QUERY_WORDS = 12
+RECALL_AT = (5, 10)
+
+# (label, precision, PCA dimensions, rescore factor)
+CONFIGURATIONS = [
+    ("float32", "float32", 0, 0),
+    ("float16", "float16", 0, 0),
+    ("float16 + rescore", "float16", 0, 4),
+    ("int8", "int8", 0, 0),
+    ("int8 + rescore", "int8", 0, 4),
+    ("pca128 float16", "float16", 128, 0),
+    ("pca128 float16 + rescore", "float16", 128, 4),
+    ("pca64 int8", "int8", 64, 0),
+    ("pca64 int8 + rescore", "int8", 64, 4),
+]
+
+class _PrecomputedEmbeddings:
+    """Serves the document vectors already computed, so each configuration indexes the same data"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return self.vectors
+
+def load_chunks(pdf_path):
+    """Load and split a PDF the same way uploads do"""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    documents = PyPDFLoader(pdf_path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150, add_start_index=True)
+    return [chunk.page_content for chunk in splitter.split_documents(documents)]
+
+def recall(found, expected):
+    return len(set(found) & set(expected)) / len(expected) if expected else 1.0
+
+def benchmark_document(pdf_path, embedding_model):
+    texts = load_chunks(pdf_path)
+    if len(texts) < max(RECALL_AT):
+        print(f"{pdf_path}: only {len(texts)} chunks, skipped")
+        return
+
+    vectors = normalize_rows(embedding_model.embed_documents(texts))
+    rng = random.Random(0)
+    queries = [" ".join(text.split()[:QUERY_WORDS]) for text in rng.sample(texts, min(QUERY_COUNT, len(texts)))]
+    query_vectors = normalize_rows(embedding_model.embed_documents(queries))
+
+    # Exact float32 neighbours are the reference
+    exact = [list(np.argsort(-(vectors @ query))[:max(RECALL_AT)]) for query in query_vectors]
+
+    print(f"\n{pdf_path}: {len(texts)} chunks, {vectors.shape[1]} dimensions, {len(queries)} queries")
+    header = f"{'configuration':<26}{'bytes/chunk':>12}{'vectors KiB':>13}" + "".join(f"{f'recall@{k}':>11}" for k in RECALL_AT) + f"{'ms/query':>10}"
+    print(header)
+    print("-" * len(header))
+    for label, precision, pca_dimensions, rescore_factor in CONFIGURATIONS:
+        store = NumpyVectorStore(
+            _PrecomputedEmbeddings(vectors), precision=precision,
+            pca_dimensions=pca_dimensions, rescore_factor=rescore_factor
+        )
+        store.add_texts(texts)
+        vector_bytes = store._vectors.nbytes + store.codec.nbytes
+
+        recalls = {k: [] for k in RECALL_AT}
+        started = time.perf_counter()
+        for query, expected in zip(query_vectors, exact):
+            found = [row for row, _ in store._top_k(query, max(RECALL_AT))]
+            for k in RECALL_AT:
+                recalls[k].append(recall(found[:k], expected[:k]))
+        elapsed_ms = (time.perf_counter() - started) / len(query_vectors) * 1000
+
+        row = f"{label:<26}{vector_bytes / len(texts):>12.0f}{vector_bytes / 1024:>13.1f}"
+        row += "".join(f"{np.mean(recalls[k]):>11.3f}" for k in RECALL_AT)
+        print(row + f"{elapsed_ms:>10.3f}")
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from ai_models import EMBEDDING_MODEL_NAME, EMBEDDING_ENCODE_KWARGS
+    embedding_model = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs=EMBEDDING_ENCODE_KWARGS)
+    for pdf_path in sys.argv[1:]:
+        benchmark_document(pdf_path, embedding_model)
+
+if __name__ == "__main__":
+    main()
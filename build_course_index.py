@@ -0,0 +1,160 @@
+"""
+build_course_index.py - Index a directory of course PDFs offline so sessions can attach to it instantly
+
+Usage: python build_course_index.py <pdf_directory> [--course NAME] [--workers N] [--backend auto|mapped|hnsw]
+
+Each PDF gets its own index files (keyed by content hash) and the course
+manifest is saved after every document, so an interrupted run resumes where
+it stopped. The per-document indexes are then merged into one course index.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from course_library import file_fingerprint, load_manifest, save_manifest, merge_course_index
+from mapped_index import index_path, index_exists, write_index, embedding_model_name, open_index
+
+# Must match the upload path so a library document and an uploaded copy produce the same chunks
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 150
+
+_embedding_model = None
+
+def load_embedding_model():
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    from ai_models import EMBEDDING_MODEL_NAME, EMBEDDING_ENCODE_KWARGS
+    return SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME, encode_kwargs=EMBEDDING_ENCODE_KWARGS)
+
+def _init_worker():
+    """Load the embedding model once per worker process"""
+    global _embedding_model
+    _embedding_model = load_embedding_model()
+
+def index_pdf(job):
+    """Worker: load, split, embed and write one PDF's index; returns its manifest entry and timings"""
+    pdf_path, fingerprint = job
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    timings = {}
+    try:
+        started = time.perf_counter()
+        documents = PyPDFLoader(pdf_path).load()
+        timings["load"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, add_start_index=True)
+        chunks = splitter.split_documents(documents)
+        for chunk in chunks:
+            chunk.metadata["source"] = os.path.basename(pdf_path)
+        timings["split"] = time.perf_counter() - started
+        if not chunks:
+            return pdf_path, None, timings, "no text found"
+
+        started = time.perf_counter()
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = _embedding_model.embed_documents(texts)
+        timings["embed"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        path = index_path(fingerprint, _embedding_model)
+        write_index(path, texts, [chunk.metadata for chunk in chunks], vectors, embedding_model_name(_embedding_model))
+        timings["write"] = time.perf_counter() - started
+    except Exception as e:
+        return pdf_path, None, timings, str(e)
+
+    entry = {
+        "file": os.path.basename(pdf_path),
+        "fingerprint": fingerprint,
+        "index": path,
+        "chunks": len(chunks),
+        "pages": len(documents),
+    }
+    return pdf_path, entry, timings, None
+
+def _format_timings(timings):
+    return " ".join(f"{stage}={seconds:.1f}s" for stage, seconds in timings.items())
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build a course index from a directory of PDFs")
+    parser.add_argument("pdf_directory")
+    parser.add_argument("--course", help="course name (default: the directory name)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--backend", choices=("auto", "mapped", "hnsw"), default="auto")
+    args = parser.parse_args()
+
+    course = args.course or os.path.basename(os.path.normpath(args.pdf_directory))
+    pdf_paths = sorted(
+        os.path.join(args.pdf_directory, name) for name in os.listdir(args.pdf_directory) if name.lower().endswith(".pdf")
+    )
+    if not pdf_paths:
+        print(f"No PDF files in {args.pdf_directory}")
+        sys.exit(1)
+
+    embedding_model = load_embedding_model()
+    manifest = load_manifest(course)
+    print(f"Course '{course}': {len(pdf_paths)} PDFs, {args.workers} workers")
+
+    # Resume: documents whose index files already exist are not processed again
+    jobs = []
+    wanted = {}
+    for pdf_path in pdf_paths:
+        fingerprint = file_fingerprint(pdf_path)
+        wanted[fingerprint] = pdf_path
+        entry = manifest["documents"].get(fingerprint)
+        if entry and index_exists(entry["index"]):
+            print(f"  skip   {os.path.basename(pdf_path)} (already indexed)")
+        elif index_exists(index_path(fingerprint, embedding_model)):
+            # Indexed for another course (or uploaded): reuse the files
+            index = open_index(index_path(fingerprint, embedding_model))
+            pages = {metadata.get("page") for metadata in index.metadatas}
+            manifest["documents"][fingerprint] = {
+                "file": os.path.basename(pdf_path),
+                "fingerprint": fingerprint,
+                "index": index.path,
+                "chunks": index.count,
+                "pages": len(pages),
+            }
+            print(f"  reuse  {os.path.basename(pdf_path)} (index files already exist)")
+        else:
+            jobs.append((pdf_path, fingerprint))
+    # Files removed from the directory leave the course
+    manifest["documents"] = {fp: entry for fp, entry in manifest["documents"].items() if fp in wanted}
+
+    started = time.perf_counter()
+    failures = 0
+    if jobs:
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=min(args.workers, len(jobs)), initializer=_init_worker) as pool:
+            for pdf_path, entry, timings, error in pool.imap_unordered(index_pdf, jobs):
+                if error:
+                    failures += 1
+                    print(f"  FAILED {os.path.basename(pdf_path)}: {error} ({_format_timings(timings)})")
+                    continue
+                manifest["documents"][entry["fingerprint"]] = entry
+                save_manifest(manifest)
+                print(f"  done   {entry['file']}: {entry['pages']} pages, {entry['chunks']} chunks ({_format_timings(timings)})")
+    print(f"Indexed {len(jobs) - failures} documents in {time.perf_counter() - started:.1f}s ({failures} failed)")
+
+    if not manifest["documents"]:
+        print("Nothing to merge.")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    index = merge_course_index(manifest, embedding_model)
+    backend = args.backend
+    if backend == "auto":
+        from vector_collections import choose_backend
+        backend = choose_backend(index.count).name
+        backend = backend if backend in ("mapped", "hnsw") else "mapped"
+    if backend == "hnsw":
+        from ann_index import open_graph
+        open_graph(index)
+    manifest["backend"] = backend
+    save_manifest(manifest)
+    print(f"Course index: {index.count} chunks, backend {backend} ({time.perf_counter() - started:.1f}s)")
+    if failures:
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -3,41 +3,174 @@ chat_handler.py - Handle chat interface and conversation logic
 """
 import streamlit as st
 from session_manager import debug_log
-from conversation_history import save_current_conversation
-from prerequisite_handler import detect_prerequisites, explain_prerequisite
+from conversation_history import save_current_conversation, current_conversation_id, saved_message, update_saved_message
+from prerequisite_handler import detect_prerequisites, stream_prerequisite_explanation
 from pdf_processor import get_raw_document_text
+from section_summaries import is_broad_question
+from page_index import answer_navigation_query
+from scheduler import SchedulerBusyError, BUSY_MESSAGE, scheduled_llm
+from ai_models import get_task_llm, stream_llm_text, TASK_ROUTES
+from deadlines import (
+    Deadline, DeadlineExceeded, PendingAnswer, PENDING_MARKER, INCOMPLETE_NOTE, call_with_deadline,
+    register_pending_answer, pending_answer_finished
+)
+from memory_governor import ensure_session_index, session_turn
+from batch_questions import split_questions, answer_questions, format_batch_answer, MAX_BATCH_QUESTIONS
+from query_router import (
+    route_message, classify_message, build_reformulation_prompt, CHIT_CHAT_REPLIES,
+    INTENT_CHIT_CHAT, INTENT_NAVIGATION, INTENT_VERBATIM, INTENT_REFORMULATION
+)
 
-def get_rag_answer(user_query, rag_chain_instance):
-    """Get answer from RAG chain"""
+def _asks_for_raw_text(query):
+    """The router's verbatim rules, so every path agrees on what counts as a raw text request"""
+    intent, _ = classify_message(query)
+    return intent == INTENT_VERBATIM
+
+def _stream_within_deadline(text_stream, source_docs, deadline):
+    """Render an answer stream until the turn deadline.
+
+    If the LLM is still going when the deadline passes, the retrieved snippets
+    (with page numbers) are shown instead, marked as pending; the answer keeps
+    generating in the background and replaces them in the saved conversation
+    when it arrives (see _hand_over_pending_answers).
+    """
+    job = PendingAnswer(text_stream)
+    partial = st.write_stream(job.iter_until(deadline))
+    partial = partial if isinstance(partial, str) else "".join(map(str, partial))
+    if job.done:
+        if job.error is not None:
+            raise job.error
+        return job.text
+    
+    debug_log("LLM missed the turn deadline, showing sources while the answer finishes")
+    degraded = f"{get_raw_document_text(source_docs)}\n\n{PENDING_MARKER}" if source_docs else PENDING_MARKER
+    st.markdown(degraded)
+    placeholder_content = f"{partial}\n\n{degraded}" if partial else degraded
+    # The caller appends and saves this reply next, then hands the job over
+    st.session_state.pending_answers[job.id] = {
+        "job": job,
+        "username": st.session_state.username,
+        "conversation_id": current_conversation_id(),
+        "index": len(st.session_state.messages),
+        "placeholder": placeholder_content,
+    }
+    return placeholder_content
+
+def _late_answer_text(job, placeholder_content):
+    if job.error is None:
+        return job.text
+    if isinstance(job.error, SchedulerBusyError):
+        return BUSY_MESSAGE
+    debug_log(f"Pending answer failed: {job.error}")
+    return placeholder_content.replace(PENDING_MARKER, INCOMPLETE_NOTE)
+
+def _hand_over_pending_answers():
+    """Once the placeholder reply is saved, let its late answer write itself into the saved conversation.
+
+    The job does this from its own thread, so the answer is kept even if the
+    user switches conversation, logs out or closes the tab before it is ready.
+    """
+    for job_id, entry in st.session_state.pending_answers.items():
+        job = entry.pop("job", None)
+        if job is None:
+            continue
+        
+        def deliver(job, entry=entry):
+            replacement = _late_answer_text(job, entry["placeholder"])
+            if not update_saved_message(entry["username"], entry["conversation_id"], entry["index"],
+                                        entry["placeholder"], replacement):
+                debug_log(f"Pending answer {job.id[:8]}: its conversation no longer holds the placeholder")
+        
+        register_pending_answer(job, deliver, (entry["conversation_id"], entry["index"]))
+
+def stream_rag_answer(user_query, rag_chain_instance, deadline=None):
+    """Retrieve, then stream the answer into the current container; returns (answer, source_docs)"""
     if not rag_chain_instance: 
         debug_log("Error: RAG Chain not initialized")
-        return "Error: RAG Chain not initialized.", []
+        answer = "Error: RAG Chain not initialized."
+        st.markdown(answer)
+        return answer, []
         
-    is_raw = any(p in user_query.lower() for p in ["exact text", "verbatim", "raw text"])
-    debug_log(f"Getting RAG answer for: {user_query[:50]}...")
+    is_raw = _asks_for_raw_text(user_query)
+    debug_log(f"Streaming RAG answer for: {user_query[:50]}...")
+    deadline = deadline or Deadline()
     
-    with st.spinner("Searching..."):
-        try:
-            response = rag_chain_instance.invoke({"query": user_query})
-            answer = response.get("result", "Not found.")
-            source_docs = response.get("source_documents", [])
-            debug_log(f"RAG answer length: {len(answer)} chars, {len(source_docs)} sources")
-            
-            if is_raw: 
-                debug_log("Raw document text requested")
-                answer = get_raw_document_text(source_docs)
-                
+    try:
+        # Broad questions are answered from the section summaries in one call
+        if is_broad_question(user_query):
+            handle = st.session_state.get("collection_handle")
+            summary_stream = rag_chain_instance.stream_summary(user_query, handle.summary() if handle else None, deadline)
+            if summary_stream is not None:
+                debug_log("Broad question, answering from summary tree")
+                answer = _stream_within_deadline(summary_stream, [], deadline)
+                return answer, []
+        
+        with st.spinner("Searching..."):
+            working_set = st.session_state.get("working_set")
+            source_docs = call_with_deadline(
+                lambda: rag_chain_instance.retrieve(user_query, working_set, deadline), deadline
+            )
+        debug_log(f"Retrieved {len(source_docs)} sources")
+        
+        if is_raw: 
+            debug_log("Raw document text requested")
+            answer = get_raw_document_text(source_docs)
+            st.markdown(answer)
             return answer, source_docs
-        except Exception as e: 
-            debug_log(f"RAG Error: {e}")
-            st.error("An error occurred.")
-            return "Error processing your question.", []
+        
+        answer = _stream_within_deadline(
+            rag_chain_instance.stream_from_docs(user_query, source_docs, deadline), source_docs, deadline
+        )
+        debug_log(f"Streamed RAG answer length: {len(answer)} chars")
+        return answer, source_docs
+    except DeadlineExceeded:
+        debug_log("Retrieval missed the turn deadline")
+        answer = "⏳ Searching the document took too long. Please try again."
+        st.markdown(answer)
+        return answer, []
+    except SchedulerBusyError:
+        debug_log("RAG request shed by the scheduler")
+        st.markdown(BUSY_MESSAGE)
+        return BUSY_MESSAGE, []
+    except Exception as e: 
+        debug_log(f"RAG Error: {e}")
+        st.error("An error occurred.")
+        return "Error processing your question.", []
+
+def resolve_pending_answers():
+    """Show late answers that have been written to the conversation on screen"""
+    pending = st.session_state.get("pending_answers") or {}
+    for job_id, entry in list(pending.items()):
+        if "job" in entry or not pending_answer_finished(job_id):
+            continue  # still generating
+        del pending[job_id]
+        if entry["conversation_id"] != st.session_state.get("current_conversation_id"):
+            continue  # written to its own conversation, which shows it when opened
+        
+        index = entry["index"]
+        messages = st.session_state.messages
+        if index < len(messages) and entry["placeholder"] in messages[index]["content"]:
+            content = saved_message(entry["username"], entry["conversation_id"], index)
+            if content is not None:
+                messages[index]["content"] = content
+
+@st.fragment(run_every=2)
+def _poll_pending_answers():
+    """Rerun the page as soon as a pending answer is ready"""
+    pending = st.session_state.get("pending_answers") or {}
+    if any("job" not in entry and pending_answer_finished(job_id) for job_id, entry in pending.items()):
+        st.rerun()
 
 def display_chat_messages():
     """Display the chat message history"""
+    resolve_pending_answers()
+    
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+    
+    if st.session_state.get("pending_answers"):
+        _poll_pending_answers()
 
 def display_prerequisite_toggle():
     """Display the prerequisite checking toggle"""
@@ -75,13 +208,17 @@ def handle_chat_input():
         with st.chat_message("user"): 
             st.markdown(prompt)
 
-        active_rag_chain = st.session_state.rag_chain
+        # Pinned for the whole turn, so a long answer cannot have its index evicted under it
+        with session_turn():
+            # The index may have been moved to disk while the session was idle
+            ensure_session_index()
+            active_rag_chain = st.session_state.rag_chain
 
-        # Handle prerequisite responses vs new questions
-        if st.session_state.waiting_for_prereq_response:
-            _handle_prerequisite_response(prompt, active_rag_chain)
-        else:
-            _handle_new_question(prompt, active_rag_chain)
+            # Handle prerequisite responses vs new messages
+            if st.session_state.waiting_for_prereq_response:
+                _handle_prerequisite_response(prompt, active_rag_chain)
+            else:
+                _route_new_message(prompt, active_rag_chain)
     
     # Show helpful message if no RAG chain but don't prevent input
     elif not st.session_state.rag_chain:
@@ -100,30 +237,28 @@ def _handle_prerequisite_response(prompt, active_rag_chain):
     debug_log(f"Prereq topic: {prereq_topic}")
     debug_log(f"Original question: {original_question[:50]}...")
     
-    # Process their answer (yes/no to explanation)
-    if any(word in prompt.lower() for word in ["yes", "y", "sure", "ok", "okay", "explain", "please"]):
-        debug_log("User wants prerequisite explanation")
-        
-        # User wants the explanation
-        with st.spinner(f"Explaining {prereq_topic}..."):
-            prereq_explanation = explain_prerequisite(prereq_topic, st.session_state.llm)
-        
-        with st.spinner("Answering original question..."):
-            answer, _ = get_rag_answer(original_question, active_rag_chain)
-        
-        # Combine explanation with answer
-        response_content = f"{prereq_explanation}\n\n{answer}"
-    else: 
-        debug_log("User skipped prerequisite explanation")
-        
-        # User skipped the explanation
-        with st.spinner("Answering question..."):
-            answer, _ = get_rag_answer(original_question, active_rag_chain)
-        response_content = answer
-    
-    # Display the answer
-    with st.chat_message("assistant"): 
-        st.markdown(response_content)
+    # Process their answer (yes/no to explanation) and stream the reply
+    with st.chat_message("assistant"):
+        if any(word in prompt.lower() for word in ["yes", "y", "sure", "ok", "okay", "explain", "please"]):
+            debug_log("User wants prerequisite explanation")
+            
+            # User wants the explanation
+            prereq_explanation = st.write_stream(
+                stream_prerequisite_explanation(
+                    prereq_topic,
+                    scheduled_llm(get_task_llm("prereq-explain"), st.session_state.username, "prereq-explain")
+                )
+            )
+            answer, _ = stream_rag_answer(original_question, active_rag_chain)
+            
+            # Combine explanation with answer
+            response_content = f"{prereq_explanation}\n\n{answer}"
+        else: 
+            debug_log("User skipped prerequisite explanation")
+            
+            # User skipped the explanation
+            answer, _ = stream_rag_answer(original_question, active_rag_chain)
+            response_content = answer
     
     # Add to message history
     st.session_state.messages.append({
@@ -133,6 +268,7 @@ def _handle_prerequisite_response(prompt, active_rag_chain):
     
     # Save conversation
     save_current_conversation(st.session_state.username)
+    _hand_over_pending_answers()
     
     # Reset prerequisite state variables
     debug_log("Resetting prerequisite state variables")
@@ -142,6 +278,138 @@ def _handle_prerequisite_response(prompt, active_rag_chain):
     st.session_state.check_prereqs = st.session_state.prereq_checkbox_state
     debug_log(f"check_prereqs set to {st.session_state.check_prereqs}")
 
+def _respond_directly(content):
+    """Show and save an assistant reply that needed no retrieval or LLM call"""
+    with st.chat_message("assistant"):
+        st.markdown(content)
+    
+    st.session_state.messages.append({
+        "role": "assistant", 
+        "content": content
+    })
+    
+    save_current_conversation(st.session_state.username)
+    st.session_state.current_question = None
+
+def _previous_answer():
+    """Last assistant answer before the message just added (None if only the greeting)"""
+    history = st.session_state.messages[:-1]
+    if len(history) < 2 or history[-1]["role"] != "assistant":
+        return None
+    return history[-1]["content"]
+
+def _route_new_message(prompt, active_rag_chain):
+    """Send the message down the cheapest path that can answer it"""
+    questions = split_questions(prompt)
+    if questions:
+        # A pasted list of questions is answered as one batch
+        _handle_question_batch(questions, active_rag_chain)
+        return
+    
+    previous_answer = _previous_answer()
+    intent, detail = route_message(
+        prompt,
+        has_previous_answer=previous_answer is not None,
+        embedding_model=st.session_state.embedding_model
+    )
+    
+    if intent == INTENT_CHIT_CHAT:
+        # No retrieval, no LLM
+        _respond_directly(CHIT_CHAT_REPLIES.get(detail, CHIT_CHAT_REPLIES["ack"]))
+        return
+    
+    if intent == INTENT_NAVIGATION:
+        # Served straight from the page index
+        navigation_answer = answer_navigation_query(prompt, st.session_state.get("page_index"))
+        if navigation_answer:
+            _respond_directly(navigation_answer)
+            return
+    
+    if intent == INTENT_VERBATIM:
+        # Retrieval only, the snippets are the answer
+        try:
+            with st.spinner("Searching..."):
+                source_docs = active_rag_chain.retrieve(prompt, st.session_state.get("working_set"))
+            content = get_raw_document_text(source_docs)
+        except SchedulerBusyError:
+            debug_log("Verbatim request shed by the scheduler")
+            content = BUSY_MESSAGE
+        except Exception as e:
+            debug_log(f"RAG Error: {e}")
+            st.error("An error occurred.")
+            content = "Error processing your question."
+        _respond_directly(content)
+        return
+    
+    if intent == INTENT_REFORMULATION:
+        # LLM only: rewrite the previous answer, no new retrieval
+        _handle_reformulation(prompt, previous_answer)
+        return
+    
+    _handle_new_question(prompt, active_rag_chain)
+
+def _handle_reformulation(prompt, previous_answer):
+    """Rewrite the previous answer as asked (shorter, simpler, as a list, ...)"""
+    llm = scheduled_llm(get_task_llm("reformulate"), st.session_state.username, "reformulate")
+    with st.chat_message("assistant"):
+        try:
+            answer = st.write_stream(stream_llm_text(llm, build_reformulation_prompt(previous_answer, prompt)))
+        except SchedulerBusyError:
+            answer = BUSY_MESSAGE
+            st.markdown(answer)
+        except Exception as e:
+            debug_log(f"Reformulation Error: {e}")
+            answer = "Error processing your question."
+            st.error("An error occurred.")
+    
+    st.session_state.messages.append({
+        "role": "assistant", 
+        "content": answer
+    })
+    
+    save_current_conversation(st.session_state.username)
+
+def _handle_question_batch(questions, active_rag_chain):
+    """Answer a pasted list of questions together and save them in one go"""
+    skipped = questions[MAX_BATCH_QUESTIONS:]
+    questions = questions[:MAX_BATCH_QUESTIONS]
+    debug_log(f"Batch mode: {len(questions)} questions ({len(skipped)} over the limit)")
+    
+    with st.chat_message("assistant"):
+        placeholder = st.empty()
+        placeholder.progress(0.0, text=f"Answering {len(questions)} questions...")
+        answered = []
+        
+        def on_answer(index, answer):
+            answered.append(index)
+            placeholder.progress(
+                len(answered) / len(questions), text=f"Answered {len(answered)} of {len(questions)} questions..."
+            )
+        
+        try:
+            answers = answer_questions(active_rag_chain, questions, on_answer)
+            content = format_batch_answer(questions, answers)
+        except Exception as e:
+            debug_log(f"Batch Error: {e}")
+            st.error("An error occurred.")
+            content = "Error processing your questions."
+        
+        if skipped:
+            content += (
+                f"\n\n*Only the first {MAX_BATCH_QUESTIONS} questions were answered. "
+                f"Send the remaining {len(skipped)} in another message.*"
+            )
+        placeholder.markdown(content)
+    
+    # All answers go into the conversation with a single save
+    st.session_state.messages.append({
+        "role": "assistant", 
+        "content": content
+    })
+    
+    save_current_conversation(st.session_state.username)
+    st.session_state.current_question = None
+
 def _handle_new_question(prompt, active_rag_chain):
     """Handle a new question from the user"""
     debug_log("Processing new question")
@@ -153,11 +421,18 @@ def _handle_new_question(prompt, active_rag_chain):
     # Log the current state of check_prereqs
     debug_log(f"check_prereqs is currently: {st.session_state.check_prereqs}")
     
+    # One deadline for the whole turn, shared by prerequisite detection, retrieval and the answer
+    deadline = Deadline()
+    
     # Check for prerequisites ONLY if check_prereqs is True
     prereq_topic = None
     if st.session_state.check_prereqs:
         debug_log("Checking for prerequisites...")
-        prereq_topic = detect_prerequisites(prompt, st.session_state.llm)
+        prereq_topic = detect_prerequisites(
+            prompt,
+            scheduled_llm(get_task_llm("prereq-detect"), st.session_state.username, "prereq-detect"),
+            timeout=min(TASK_ROUTES["prereq-detect"]["timeout"], deadline.remaining())
+        )
         debug_log(f"Prerequisite detection result: {prereq_topic}")
         
         # Skip if we've already explained this prerequisite
@@ -199,15 +474,11 @@ def _handle_new_question(prompt, active_rag_chain):
     else:
         debug_log("No prerequisite needed or detected")
         
-        # No prerequisite needed - answer directly
-        with st.spinner("Searching for answer..."):
-            answer, _ = get_rag_answer(prompt, active_rag_chain)
-        
-        debug_log("Got direct answer, displaying")
-        
-        # Display and save the direct answer
+        # No prerequisite needed - stream the answer directly
         with st.chat_message("assistant"): 
-            st.markdown(answer)
+            answer, _ = stream_rag_answer(prompt, active_rag_chain, deadline)
+        
+        debug_log("Streamed direct answer, saving")
         
         st.session_state.messages.append({
             "role": "assistant", 
@@ -215,6 +486,7 @@ def _handle_new_question(prompt, active_rag_chain):
         })
         
         save_current_conversation(st.session_state.username)
+        _hand_over_pending_answers()
         
         # Reset question state but preserve check_prereqs flag
         st.session_state.current_question = None
@@ -223,6 +495,6 @@ def _handle_new_question(prompt, active_rag_chain):
 def display_context_caption():
     """Display context information about the current session"""
     if st.session_state.rag_chain and st.session_state.processed_file_name:
-        st.caption(f"Chatting with: '{st.session_state.processed_file_name}' - LLM: gemini-1.5-flash")
+        st.caption(f"Chatting with: '{st.session_state.processed_file_name}' - LLM: {TASK_ROUTES['answer']['model']}")
     elif not st.session_state.processed_file_name:
-        st.caption(f"LLM: gemini-1.5-flash - Upload PDF to start or select history.")
\ No newline at end of file
+        st.caption(f"LLM: {TASK_ROUTES['answer']['model']} - Upload PDF to start or select history.")
\ No newline at end of file
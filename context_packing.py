@@ -0,0 +1,93 @@
+"""
+context_packing.py - Merge overlapping retrieved chunks before they are stuffed into the prompt
+"""
+from langchain.schema import Document
+import metrics
+from session_manager import debug_log
+
+# Rough token estimate used for budgeting (Gemini averages ~4 characters per token)
+CHARS_PER_TOKEN = 4
+# Upper bound on context tokens sent with a question
+MAX_CONTEXT_TOKENS = 1500
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+class _Span:
+    def __init__(self, doc, rank):
+        self.start = doc.metadata["start_index"]
+        self.end = self.start + len(doc.page_content)
+        self.text = doc.page_content
+        self.best_rank = rank
+        self.chunks = 1
+        self.metadata = doc.metadata
+
+    def absorb(self, doc, rank):
+        """Extend this span with a chunk that overlaps it or starts right where it ends"""
+        start = doc.metadata["start_index"]
+        end = start + len(doc.page_content)
+        if end > self.end:
+            self.text += doc.page_content[self.end - start:]
+            self.end = end
+        self.best_rank = min(self.best_rank, rank)
+        self.chunks += 1
+
+    def to_document(self):
+        metadata = dict(self.metadata)
+        metadata.update({"start_index": self.start, "end_index": self.end, "merged_chunks": self.chunks})
+        return Document(page_content=self.text, metadata=metadata)
+
+def pack_documents(docs, token_budget=MAX_CONTEXT_TOKENS):
+    """Group hits by (source, page), merge overlapping/touching spans, order them and enforce a token budget.
+
+    Chunks without a start_index (older indexes) are passed through unchanged.
+    When over budget, the spans containing the lowest-ranked hits are dropped first;
+    the survivors are returned in document order.
+    """
+    if not docs:
+        return []
+
+    groups = {}
+    loose = []
+    for rank, doc in enumerate(docs):
+        if "start_index" not in doc.metadata:
+            loose.append((rank, doc))
+            continue
+        key = (doc.metadata.get("source", ""), doc.metadata.get("page", -1))
+        groups.setdefault(key, []).append((rank, doc))
+
+    spans = []
+    for key, hits in groups.items():
+        hits.sort(key=lambda hit: hit[1].metadata["start_index"])
+        current = None
+        for rank, doc in hits:
+            # Only text that is really contiguous becomes one snippet; a gap would silently drop text
+            if current and doc.metadata["start_index"] <= current.end:
+                current.absorb(doc, rank)
+            else:
+                current = _Span(doc, rank)
+                spans.append((key, current))
+
+    # Candidates in relevance order, then cut to the budget
+    candidates = [(span.best_rank, key, span.start, span.to_document()) for key, span in spans]
+    candidates += [(rank, (doc.metadata.get("source", ""), doc.metadata.get("page", -1)), 0, doc) for rank, doc in loose]
+    candidates.sort(key=lambda c: c[0])
+
+    kept = []
+    used_tokens = 0
+    for candidate in candidates:
+        tokens = estimate_tokens(candidate[3].page_content)
+        if kept and used_tokens + tokens > token_budget:
+            continue
+        kept.append(candidate)
+        used_tokens += tokens
+
+    kept.sort(key=lambda c: (c[1], c[2]))
+    packed = [c[3] for c in kept]
+
+    raw_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+    metrics.increment("context.raw_tokens", raw_tokens)
+    metrics.increment("context.packed_tokens", used_tokens)
+    debug_log(f"Context packing: {len(docs)} chunks ({raw_tokens} tokens) -> {len(packed)} snippets ({used_tokens} tokens)")
+    return packed
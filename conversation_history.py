@@ -2,14 +2,24 @@
 conversation_history.py - Module to manage conversation histories using SQLite database
 """
 import streamlit as st
-from database_manager import save_conversation, load_user_conversations, load_conversation, delete_conversation
+from working_set import WorkingSet
+from database_manager import new_conversation_id, list_conversations, load_conversation, delete_conversation
+from write_behind import enqueue_save, flush_saves
+from deadlines import PENDING_MARKER, INCOMPLETE_NOTE, pending_answer_targets
 
 def display_history_sidebar(username):
     """Display the conversation history sidebar"""
     if not username:
         return None
     
-    history = load_user_conversations(username)
+    # Summaries only, one keyset page at a time (queued saves may still be on their way); messages load when a conversation is opened
+    history = []
+    next_page = None
+    for _ in range(st.session_state.get('history_pages', 1)):
+        page, next_page = list_conversations(username, after=next_page)
+        history.extend(page)
+        if next_page is None:
+            break
     
     if not history:
         st.sidebar.info("No saved conversations.")
@@ -27,10 +37,12 @@ def display_history_sidebar(username):
         st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you today?"}]
         st.session_state.current_conversation_id = None
         st.session_state.loaded_convo_id = None  # IMPORTANT: Reset loaded convo ID
+        st.session_state.working_set = WorkingSet()
         st.rerun()
     
     # List of conversations
-    for conv_id, conv_data in sorted(history.items(), key=lambda x: x[1]['last_updated'], reverse=True):
+    for conv_data in history:
+        conv_id = conv_data['id']
         title = conv_data['title']
         document = conv_data.get('document', '')
         # Convert ISO format date to display format
@@ -49,9 +61,14 @@ def display_history_sidebar(username):
         
         # Display the conversation button
         if col1.button(f"{title}{doc_label}\n{date}", key=f"hist_{conv_id}"):
-            st.session_state.messages = conv_data['messages']
+            conversation = open_conversation(username, conv_id)
+            if not conversation:
+                st.sidebar.error("This conversation could not be loaded.")
+                return st.session_state.current_conversation_id
+            st.session_state.messages = conversation['messages']
             st.session_state.current_conversation_id = conv_id
             st.session_state.loaded_convo_id = conv_id  # IMPORTANT: Set loaded convo ID
+            st.session_state.working_set = WorkingSet()
             
             # If the conversation is associated with a document different from the current one
             if document and document != st.session_state.get('processed_file_name', ''):
@@ -67,32 +84,104 @@ def display_history_sidebar(username):
         
         # Delete button
         if col3.button("🗑️", key=f"del_{conv_id}", help="Delete conversation"):
+            flush_saves()  # a queued save would bring it back
             if delete_conversation(username, conv_id):
                 if st.session_state.current_conversation_id == conv_id:
                     st.session_state.current_conversation_id = None
                     st.session_state.loaded_convo_id = None  # IMPORTANT: Reset loaded convo ID
+                    st.session_state.working_set = WorkingSet()
                     st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you today?"}]
                 st.rerun()
     
+    if next_page is not None and st.sidebar.button("Load more", key="history_load_more"):
+        st.session_state.history_pages = st.session_state.get('history_pages', 1) + 1
+        st.rerun()
+    
     return st.session_state.current_conversation_id
 
-def save_current_conversation(username):
-    """Save the current conversation"""
+def open_conversation(username, conversation_id):
+    """Load a conversation to show it, closing out answers that were pending when this process lost them"""
+    flush_saves()  # queued saves of this conversation must be read back
+    conversation = load_conversation(username, conversation_id)
+    if not conversation:
+        return conversation
+    
+    # Late answers write themselves back; a marker with no job behind it (e.g. after a restart) never will
+    live = pending_answer_targets()
+    lost = [
+        index for index, message in enumerate(conversation['messages'])
+        if PENDING_MARKER in message['content'] and (conversation_id, index) not in live
+    ]
+    for index in lost:
+        message = conversation['messages'][index]
+        message['content'] = message['content'].replace(PENDING_MARKER, INCOMPLETE_NOTE)
+    if lost:
+        enqueue_save(
+            username=username,
+            conversation_id=conversation_id,
+            title=conversation['title'],
+            messages=conversation['messages'],
+            document_name=conversation['document'],
+            edited=lost
+        )
+    return conversation
+
+def current_conversation_id():
+    """ID of the conversation on screen, assigned now if it has none yet"""
+    conversation_id = st.session_state.get('current_conversation_id')
+    if not conversation_id:
+        # Assigned here so the session knows its ID before the background write happens
+        conversation_id = new_conversation_id()
+        st.session_state.current_conversation_id = conversation_id
+        st.session_state.loaded_convo_id = conversation_id  # IMPORTANT: Update loaded convo ID
+    return conversation_id
+
+def save_current_conversation(username, edited=None):
+    """Queue a save of the current conversation (`edited`: indexes of already-saved messages that changed)"""
     if not username or not st.session_state.get('messages'):
         return
     
-    conversation_id = st.session_state.get('current_conversation_id')
+    # A conversation holding only the greeting is not worth a sidebar entry
+    if not any(message['role'] == 'user' for message in st.session_state.messages):
+        return
+    
+    conversation_id = current_conversation_id()
     title = None  # Let the save_conversation function generate a title
     document_name = st.session_state.get('processed_file_name', '')
     
-    new_id = save_conversation(
+    enqueue_save(
         username=username, 
         conversation_id=conversation_id, 
         title=title, 
         messages=st.session_state.messages,
-        document_name=document_name
+        document_name=document_name,
+        edited=edited
     )
-    
-    if not conversation_id:
-        st.session_state.current_conversation_id = new_id
-        st.session_state.loaded_convo_id = new_id  # IMPORTANT: Update loaded convo ID
\ No newline at end of file
+
+def saved_message(username, conversation_id, index):
+    """Content of one message of a saved conversation, or None"""
+    flush_saves()
+    conversation = load_conversation(username, conversation_id)
+    if not conversation or index >= len(conversation['messages']):
+        return None
+    return conversation['messages'][index]['content']
+
+def update_saved_message(username, conversation_id, index, old_text, new_text):
+    """Replace text in one message of a saved conversation; False if the message no longer holds old_text"""
+    flush_saves()  # the conversation's last turn may still be queued
+    conversation = load_conversation(username, conversation_id)
+    if not conversation:
+        return False
+    messages = conversation['messages']
+    if index >= len(messages) or old_text not in messages[index]['content']:
+        return False
+    messages[index]['content'] = messages[index]['content'].replace(old_text, new_text)
+    enqueue_save(
+        username=username,
+        conversation_id=conversation_id,
+        title=conversation['title'],
+        messages=messages,
+        document_name=conversation['document'],
+        edited=[index]
+    )
+    return True
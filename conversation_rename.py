@@ -65,6 +65,10 @@ def rename_conversation(username, conversation_id, new_title):
     """Rename a conversation in the database"""
     try:
         from database_manager import load_conversation
+        from write_behind import flush_saves
+        
+        # Write any queued save first so the rename starts from the latest messages
+        flush_saves()
         
         # Load the conversation
         conversation = load_conversation(username, conversation_id)
@@ -0,0 +1,71 @@
+"""
+course_library.py - Pre-built course indexes (many PDFs) that sessions can attach to without uploading
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from session_manager import debug_log
+from mapped_index import INDEX_STORE_DIR, index_path, index_exists, open_index, write_index, embedding_model_name
+
+COURSES_DIR = os.path.join(INDEX_STORE_DIR, "courses")
+
+def file_fingerprint(pdf_path):
+    """Same content hash as uploads, so a library document and an uploaded copy share index files"""
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as pdf_file:
+        for block in iter(lambda: pdf_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def course_fingerprint(document_fingerprints):
+    return hashlib.sha256("\n".join(sorted(document_fingerprints)).encode("utf-8")).hexdigest()
+
+def manifest_path(course):
+    return os.path.join(COURSES_DIR, f"{course}.json")
+
+def load_manifest(course):
+    """The course manifest, or a fresh one if the course was never built"""
+    try:
+        with open(manifest_path(course), encoding="utf-8") as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {"course": course, "documents": {}, "index": None, "backend": None, "fingerprint": None}
+
+def save_manifest(manifest):
+    """Write the manifest atomically (the indexer saves it after every document)"""
+    os.makedirs(COURSES_DIR, exist_ok=True)
+    path = manifest_path(manifest["course"])
+    with open(f"{path}.tmp", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+def list_courses():
+    """Names of the courses whose combined index is ready"""
+    if not os.path.isdir(COURSES_DIR):
+        return []
+    courses = []
+    for file_name in sorted(os.listdir(COURSES_DIR)):
+        if file_name.endswith(".json"):
+            manifest = load_manifest(file_name[:-len(".json")])
+            if manifest.get("index") and index_exists(manifest["index"]):
+                courses.append(manifest["course"])
+    return courses
+
+def merge_course_index(manifest, embedding_model):
+    """Concatenate the per-document indexes into one course index (no re-embedding)"""
+    documents = sorted(manifest["documents"].values(), key=lambda document: document["file"])
+    fingerprint = course_fingerprint(document["fingerprint"] for document in documents)
+    path = index_path(fingerprint, embedding_model)
+    if not index_exists(path):
+        texts, metadatas, vectors = [], [], []
+        for document in documents:
+            index = open_index(document["index"])
+            texts.extend(index.text(row) for row in range(index.count))
+            metadatas.extend(index.metadatas)
+            vectors.append(np.asarray(index.embeddings))
+        write_index(path, texts, metadatas, np.vstack(vectors), embedding_model_name(embedding_model))
+        debug_log(f"Merged {len(documents)} documents into course index {os.path.basename(path)}")
+    manifest["fingerprint"] = fingerprint
+    manifest["index"] = path
+    return open_index(path)
@@ -2,17 +2,93 @@
 database_manager.py - SQLite database implementation for the Educational Chatbot
 """
 import os
+import queue
 import sqlite3
 import json
+import threading
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 import hashlib
 
 # Path to the database file
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot_data.db")
 
+# Idle connections kept open for reuse across reruns and sessions
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# How long a statement waits for another writer's lock before failing
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+# Conversations listed per sidebar page
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "20"))
+
+_pool = queue.LifoQueue(maxsize=DB_POOL_SIZE)
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def _open_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    # WAL lets readers run while another session is writing
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    # With WAL this can lose the last commits on power loss but never corrupts the file
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-8000")
+    return conn
+
+@contextmanager
+def get_connection():
+    """Borrow a pooled connection; only the borrowing thread uses it until the block ends"""
+    if not _schema_ready:
+        initialize_database()
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+def close_connections():
+    """Close the idle pooled connections"""
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
+
 def initialize_database():
-    """Initialize the SQLite database with required tables if they don't exist"""
-    conn = sqlite3.connect(DB_PATH)
+    """Initialize the SQLite database with required tables if they don't exist (once per process)"""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return True
+        conn = _open_connection()
+        is_new = not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+        ).fetchone()
+        _create_schema(conn)
+        conn.close()
+        _schema_ready = True
+    
+    print(f"Database initialized at {DB_PATH}")
+    if is_new:
+        # Nothing to convert yet, so a new database starts at the latest version
+        return apply_migrations()
+    
+    pending = pending_migrations()
+    if pending:
+        print(f"{len(pending)} database migrations pending; run migrate_database.py to apply them.")
+    return True
+
+def _create_schema(conn):
     cursor = conn.cursor()
     
     # Create users table
@@ -39,10 +115,96 @@ def initialize_database():
     )
     ''')
     
+    # Applied schema migrations (see SCHEMA_MIGRATIONS)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )
+    ''')
+    
+    # Create messages table: one row per turn, appended as the conversation grows
+    # (conversations.messages only holds pre-migration JSON and is '[]' otherwise)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS messages (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (conversation_id, seq),
+        FOREIGN KEY (conversation_id) REFERENCES conversations (conversation_id)
+    )
+    ''')
+    
     conn.commit()
-    conn.close()
+
+# Schema migrations, applied in order by apply_migrations()
+def _index_conversations_by_user(cursor):
+    # Serves the sidebar listing (and its keyset pages) straight from the index, already sorted
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversations_user_updated "
+        "ON conversations (username, last_updated, conversation_id)"
+    )
+    cursor.execute("ANALYZE")
+
+def _split_message_blobs(cursor):
+    # Conversations saved before the messages table kept their turns as one JSON blob
+    cursor.execute(
+        "SELECT conversation_id, last_updated, messages FROM conversations WHERE messages != '[]'"
+    )
+    rows = cursor.fetchall()
+    
+    for conversation_id, last_updated, messages_json in rows:
+        # Rows already appended by a save since the upgrade are newer than the blob
+        cursor.execute("SELECT 1 FROM messages WHERE conversation_id = ? LIMIT 1", (conversation_id,))
+        if not cursor.fetchone():
+            cursor.executemany(
+                "INSERT INTO messages (conversation_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(conversation_id, seq, msg['role'], msg['content'], last_updated)
+                 for seq, msg in enumerate(json.loads(messages_json or '[]'))]
+            )
+        cursor.execute("UPDATE conversations SET messages = '[]' WHERE conversation_id = ?", (conversation_id,))
+    
+    print(f"Moved the messages of {len(rows)} conversations into the messages table.")
+
+# (version, description, migration); append new ones, never renumber or edit applied ones
+SCHEMA_MIGRATIONS = [
+    (1, "Index conversations by user and last update", _index_conversations_by_user),
+    (2, "Move JSON message blobs into the messages table", _split_message_blobs),
+]
+
+def schema_version():
+    """Version of the last migration applied to the database (0 if none)"""
+    with get_connection() as conn:
+        return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def pending_migrations():
+    current = schema_version()
+    return [migration for migration in SCHEMA_MIGRATIONS if migration[0] > current]
+
+def apply_migrations():
+    """Apply the pending schema migrations in order, each in its own transaction"""
+    for version, description, migrate in pending_migrations():
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            try:
+                cursor.execute("BEGIN")
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat())
+                )
+                conn.commit()
+                print(f"Applied database migration {version}: {description}")
+                
+            except Exception as e:
+                conn.rollback()
+                print(f"Error applying database migration {version}: {e}")
+                return False
     
-    print(f"Database initialized at {DB_PATH}")
     return True
 
 def hash_password(password):
@@ -52,237 +214,326 @@ def hash_password(password):
 # User management functions
 def create_user(username, password, email):
     """Create a new user in the database"""
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # Check if username already exists
-        cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
-        if cursor.fetchone():
-            conn.close()
-            return False, "This username already exists."
-        
-        # Check if email is already in use
-        cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
-        if cursor.fetchone():
-            conn.close()
-            return False, "This email is already in use."
-        
-        # Create new user
-        created_at = datetime.now().isoformat()
-        password_hash = hash_password(password)
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        cursor.execute(
-            "INSERT INTO users (username, password_hash, email, created_at) VALUES (?, ?, ?, ?)",
-            (username, password_hash, email, created_at)
-        )
-        
-        conn.commit()
-        conn.close()
-        return True, "Account created successfully!"
-        
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        print(f"Error creating user: {e}")
-        return False, f"Error creating account: {str(e)}"
+        try:
+            # Check if username already exists
+            cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
+            if cursor.fetchone():
+                return False, "This username already exists."
+            
+            # Check if email is already in use
+            cursor.execute("SELECT email FROM users WHERE email = ?", (email,))
+            if cursor.fetchone():
+                return False, "This email is already in use."
+            
+            # Create new user
+            created_at = datetime.now().isoformat()
+            password_hash = hash_password(password)
+            
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, email, created_at) VALUES (?, ?, ?, ?)",
+                (username, password_hash, email, created_at)
+            )
+            
+            conn.commit()
+            return True, "Account created successfully!"
+            
+        except Exception as e:
+            conn.rollback()
+            print(f"Error creating user: {e}")
+            return False, f"Error creating account: {str(e)}"
 
 def authenticate_user(username, password):
     """Authenticate a user against the database"""
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            # Check if user exists and password matches
+            cursor.execute(
+                "SELECT password_hash FROM users WHERE username = ?", 
+                (username,)
+            )
+            result = cursor.fetchone()
+            
+            if not result:
+                return False, "Incorrect username or password."
+            
+            stored_hash = result[0]
+            if stored_hash != hash_password(password):
+                return False, "Incorrect username or password."
+            
+            # Update last login time
+            last_login = datetime.now().isoformat()
+            cursor.execute(
+                "UPDATE users SET last_login = ? WHERE username = ?",
+                (last_login, username)
+            )
+            
+            conn.commit()
+            return True, "Login successful!"
+            
+        except Exception as e:
+            print(f"Error authenticating user: {e}")
+            return False, f"Error during login: {str(e)}"
+
+# Conversation management functions
+def _load_messages(cursor, conversation_id, legacy_json):
+    cursor.execute(
+        "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY seq",
+        (conversation_id,)
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        # Not migrated yet (see _split_message_blobs)
+        return json.loads(legacy_json or '[]')
+    return [{'role': role, 'content': content} for role, content in rows]
+
+def new_conversation_id():
+    """A conversation ID callers can assign before the first save (unique across sessions)"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def _write_conversation(cursor, username, conversation_id, title, messages, document_name=None, edited=None):
+    """Write one conversation inside the caller's transaction"""
+    # Generate a title if none is provided
+    if not title and messages:
+        # Use the beginning of the first user question as the title
+        for msg in messages:
+            if msg['role'] == 'user':
+                title = msg['content'][:30] + '...' if len(msg['content']) > 30 else msg['content']
+                break
+        if not title:
+            title = f"Conversation {conversation_id}"
     
-    try:
-        # Check if user exists and password matches
+    last_updated = datetime.now().isoformat()
+    
+    # Check if conversation already exists
+    cursor.execute(
+        "SELECT conversation_id FROM conversations WHERE conversation_id = ?", 
+        (conversation_id,)
+    )
+    
+    if cursor.fetchone():
+        # Update existing conversation
         cursor.execute(
-            "SELECT password_hash FROM users WHERE username = ?", 
-            (username,)
+            "UPDATE conversations SET title = ?, last_updated = ?, document_name = ? WHERE conversation_id = ?",
+            (title, last_updated, document_name, conversation_id)
         )
-        result = cursor.fetchone()
-        
-        if not result:
-            conn.close()
-            return False, "Incorrect username or password."
-        
-        stored_hash = result[0]
-        if stored_hash != hash_password(password):
-            conn.close()
-            return False, "Incorrect username or password."
-        
-        # Update last login time
-        last_login = datetime.now().isoformat()
+    else:
+        # Insert new conversation
         cursor.execute(
-            "UPDATE users SET last_login = ? WHERE username = ?",
-            (last_login, username)
+            "INSERT INTO conversations (conversation_id, username, title, last_updated, messages, document_name) VALUES (?, ?, ?, ?, '[]', ?)",
+            (conversation_id, username, title, last_updated, document_name)
         )
-        
-        conn.commit()
-        conn.close()
-        return True, "Login successful!"
-        
-    except Exception as e:
-        conn.close()
-        print(f"Error authenticating user: {e}")
-        return False, f"Error during login: {str(e)}"
+    
+    # Append the turns after the last saved one
+    cursor.execute("SELECT MAX(seq) FROM messages WHERE conversation_id = ?", (conversation_id,))
+    max_seq = cursor.fetchone()[0]
+    saved = max_seq + 1 if max_seq is not None else 0
+    if len(messages) < saved:
+        cursor.execute(
+            "DELETE FROM messages WHERE conversation_id = ? AND seq >= ?",
+            (conversation_id, len(messages))
+        )
+    cursor.executemany(
+        "INSERT INTO messages (conversation_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(conversation_id, seq, msg['role'], msg['content'], last_updated)
+         for seq, msg in enumerate(messages[saved:], start=saved)]
+    )
+    
+    # Rewrite turns changed in place (e.g. a pending answer filled in)
+    cursor.executemany(
+        "UPDATE messages SET content = ? WHERE conversation_id = ? AND seq = ?",
+        [(messages[seq]['content'], conversation_id, seq)
+         for seq in (edited or ()) if seq < min(saved, len(messages))]
+    )
 
-# Conversation management functions
-def save_conversation(username, conversation_id, title, messages, document_name=None):
-    """Save a conversation to the database"""
+def save_conversation(username, conversation_id, title, messages, document_name=None, edited=None):
+    """Save a conversation to the database: new turns are appended, turns listed in `edited` rewritten"""
     if not username:
         return None
     
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        # If it's a new conversation, create a new ID
-        if not conversation_id:
-            conversation_id = datetime.now().strftime("%Y%m%d%H%M%S")
-        
-        # Generate a title if none is provided
-        if not title and messages:
-            # Use the beginning of the first user question as the title
-            for msg in messages:
-                if msg['role'] == 'user':
-                    title = msg['content'][:30] + '...' if len(msg['content']) > 30 else msg['content']
-                    break
-            if not title:
-                title = f"Conversation {conversation_id}"
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        last_updated = datetime.now().isoformat()
-        messages_json = json.dumps(messages)
+        try:
+            # If it's a new conversation, create a new ID
+            if not conversation_id:
+                conversation_id = new_conversation_id()
+            
+            _write_conversation(cursor, username, conversation_id, title, messages, document_name, edited)
+            conn.commit()
+            return conversation_id
+            
+        except Exception as e:
+            conn.rollback()
+            print(f"Error saving conversation: {e}")
+            return None
+
+def save_conversations(saves):
+    """Save several conversations (dicts of save_conversation's arguments) in one transaction"""
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        # Check if conversation already exists
-        cursor.execute(
-            "SELECT conversation_id FROM conversations WHERE conversation_id = ?", 
-            (conversation_id,)
-        )
+        try:
+            for save in saves:
+                _write_conversation(cursor, **save)
+            conn.commit()
+            return True
+            
+        except Exception as e:
+            conn.rollback()
+            print(f"Error saving conversations: {e}")
+            return False
+
+def load_user_conversations(username):
+    """Load all conversations for a user"""
+    if not username:
+        return {}
+    
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row  # This enables column access by name
+        cursor = conn.cursor()
         
-        if cursor.fetchone():
-            # Update existing conversation
+        try:
             cursor.execute(
-                "UPDATE conversations SET title = ?, last_updated = ?, messages = ?, document_name = ? WHERE conversation_id = ?",
-                (title, last_updated, messages_json, document_name, conversation_id)
+                "SELECT * FROM conversations WHERE username = ? ORDER BY last_updated DESC",
+                (username,)
             )
-        else:
-            # Insert new conversation
+            
+            rows = cursor.fetchall()
+            conversations = {}
+            
+            for row in rows:
+                conversations[row['conversation_id']] = {
+                    'title': row['title'],
+                    'last_updated': row['last_updated'],
+                    'messages': [],
+                    'document': row['document_name'] or ''
+                }
+            
+            # All of the user's turns in one query
             cursor.execute(
-                "INSERT INTO conversations (conversation_id, username, title, last_updated, messages, document_name) VALUES (?, ?, ?, ?, ?, ?)",
-                (conversation_id, username, title, last_updated, messages_json, document_name)
+                "SELECT m.conversation_id, m.role, m.content FROM messages m "
+                "JOIN conversations c ON c.conversation_id = m.conversation_id "
+                "WHERE c.username = ? ORDER BY m.conversation_id, m.seq",
+                (username,)
             )
-        
-        conn.commit()
-        conn.close()
-        return conversation_id
-        
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        print(f"Error saving conversation: {e}")
-        return None
+            for row in cursor.fetchall():
+                conversations[row['conversation_id']]['messages'].append({'role': row['role'], 'content': row['content']})
+            
+            # Conversations not migrated yet still carry their JSON
+            for row in rows:
+                if not conversations[row['conversation_id']]['messages']:
+                    conversations[row['conversation_id']]['messages'] = json.loads(row['messages'] or '[]')
+            
+            return conversations
+            
+        except Exception as e:
+            print(f"Error loading conversations: {e}")
+            return {}
 
-def load_user_conversations(username):
-    """Load all conversations for a user"""
-    if not username:
-        return {}
+def list_conversations(username, limit=HISTORY_PAGE_SIZE, after=None):
+    """One page of a user's conversation summaries, newest first, without their messages.
     
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # This enables column access by name
-    cursor = conn.cursor()
+    Returns (summaries, cursor); pass the cursor back as `after` for the next page (None when there are no more).
+    """
+    if not username:
+        return [], None
     
-    try:
-        cursor.execute(
-            "SELECT * FROM conversations WHERE username = ? ORDER BY last_updated DESC",
-            (username,)
-        )
-        
-        rows = cursor.fetchall()
-        conversations = {}
-        
-        for row in rows:
-            conversations[row['conversation_id']] = {
-                'title': row['title'],
-                'last_updated': row['last_updated'],
-                'messages': json.loads(row['messages']),
-                'document': row['document_name'] or ''
-            }
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        conn.close()
-        return conversations
-        
-    except Exception as e:
-        conn.close()
-        print(f"Error loading conversations: {e}")
-        return {}
+        try:
+            # Keyset pagination: continue after the last (last_updated, conversation_id) shown
+            if after:
+                cursor.execute(
+                    "SELECT conversation_id, title, last_updated, document_name FROM conversations "
+                    "WHERE username = ? AND (last_updated, conversation_id) < (?, ?) "
+                    "ORDER BY last_updated DESC, conversation_id DESC LIMIT ?",
+                    (username, after[0], after[1], limit + 1)
+                )
+            else:
+                cursor.execute(
+                    "SELECT conversation_id, title, last_updated, document_name FROM conversations "
+                    "WHERE username = ? ORDER BY last_updated DESC, conversation_id DESC LIMIT ?",
+                    (username, limit + 1)
+                )
+            
+            rows = cursor.fetchall()
+            summaries = [
+                {'id': conversation_id, 'title': title, 'last_updated': last_updated, 'document': document_name or ''}
+                for conversation_id, title, last_updated, document_name in rows[:limit]
+            ]
+            
+            next_cursor = None
+            if len(rows) > limit:
+                next_cursor = (summaries[-1]['last_updated'], summaries[-1]['id'])
+            return summaries, next_cursor
+            
+        except Exception as e:
+            print(f"Error listing conversations: {e}")
+            return [], None
 
 def load_conversation(username, conversation_id):
     """Load a specific conversation"""
     if not username or not conversation_id:
         return None
     
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(
-            "SELECT * FROM conversations WHERE username = ? AND conversation_id = ?",
-            (username, conversation_id)
-        )
+    with get_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
         
-        row = cursor.fetchone()
-        if not row:
-            conn.close()
+        try:
+            cursor.execute(
+                "SELECT * FROM conversations WHERE username = ? AND conversation_id = ?",
+                (username, conversation_id)
+            )
+            
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            conversation = {
+                'title': row['title'],
+                'last_updated': row['last_updated'],
+                'messages': _load_messages(cursor, conversation_id, row['messages']),
+                'document': row['document_name'] or ''
+            }
+            
+            return conversation
+            
+        except Exception as e:
+            print(f"Error loading conversation: {e}")
             return None
-        
-        conversation = {
-            'title': row['title'],
-            'last_updated': row['last_updated'],
-            'messages': json.loads(row['messages']),
-            'document': row['document_name'] or ''
-        }
-        
-        conn.close()
-        return conversation
-        
-    except Exception as e:
-        conn.close()
-        print(f"Error loading conversation: {e}")
-        return None
 
 def delete_conversation(username, conversation_id):
     """Delete a conversation from the database"""
     if not username or not conversation_id:
         return False
     
-    initialize_database()
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
-        cursor.execute(
-            "DELETE FROM conversations WHERE username = ? AND conversation_id = ?",
-            (username, conversation_id)
-        )
+    with get_connection() as conn:
+        cursor = conn.cursor()
         
-        if cursor.rowcount > 0:
-            conn.commit()
-            conn.close()
-            return True
-        else:
-            conn.close()
-            return False
+        try:
+            cursor.execute(
+                "DELETE FROM conversations WHERE username = ? AND conversation_id = ?",
+                (username, conversation_id)
+            )
             
-    except Exception as e:
-        conn.rollback()
-        conn.close()
-        print(f"Error deleting conversation: {e}")
-        return False
+            if cursor.rowcount > 0:
+                cursor.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                conn.commit()
+                return True
+            else:
+                return False
+                
+        except Exception as e:
+            conn.rollback()
+            print(f"Error deleting conversation: {e}")
+            return False
 
 # Migration function to import existing data
 def migrate_from_json():
@@ -301,26 +552,25 @@ def migrate_from_json():
             with open(USER_DB_PATH, 'r') as file:
                 users = json.load(file)
             
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            for username, user_data in users.items():
-                # Check if user already exists in database
-                cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
-                if not cursor.fetchone():
-                    cursor.execute(
-                        "INSERT INTO users (username, password_hash, email, created_at, last_login) VALUES (?, ?, ?, ?, ?)",
-                        (
-                            username, 
-                            user_data.get('password_hash', ''), 
-                            user_data.get('email', ''), 
-                            user_data.get('created_at', datetime.now().isoformat()),
-                            user_data.get('last_login')
+            with get_connection() as conn:
+                cursor = conn.cursor()
+                
+                for username, user_data in users.items():
+                    # Check if user already exists in database
+                    cursor.execute("SELECT username FROM users WHERE username = ?", (username,))
+                    if not cursor.fetchone():
+                        cursor.execute(
+                            "INSERT INTO users (username, password_hash, email, created_at, last_login) VALUES (?, ?, ?, ?, ?)",
+                            (
+                                username, 
+                                user_data.get('password_hash', ''), 
+                                user_data.get('email', ''), 
+                                user_data.get('created_at', datetime.now().isoformat()),
+                                user_data.get('last_login')
+                            )
                         )
-                    )
-            
-            conn.commit()
-            conn.close()
+                
+                conn.commit()
             print("Users migrated successfully.")
         except Exception as e:
             print(f"Error migrating users: {e}")
@@ -0,0 +1,141 @@
+"""
+deadlines.py - End-to-end chat turn deadlines and answers that finish after the deadline
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+import metrics
+from session_manager import debug_log
+
+# How long a chat turn may keep the user waiting before degrading
+CHAT_TURN_DEADLINE_SECONDS = float(os.getenv("CHAT_TURN_DEADLINE_SECONDS", "20"))
+
+PENDING_MARKER = "⏳ *Full answer pending — it will appear here when ready.*"
+# Replaces the marker when the late answer failed or was lost
+INCOMPLETE_NOTE = "*The full answer could not be completed. Please ask again.*"
+
+_RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+_pending_lock = threading.Lock()
+_PENDING_ANSWERS = {}
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage of the chat turn runs past the turn deadline"""
+
+class Deadline:
+    """Absolute point in time by which a chat turn should have answered"""
+
+    def __init__(self, seconds=CHAT_TURN_DEADLINE_SECONDS):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+def call_with_deadline(fn, deadline, stage="retrieval"):
+    """Run fn() but stop waiting for it when the deadline passes"""
+    if deadline is None:
+        return fn()
+    future = _RETRIEVAL_EXECUTOR.submit(fn)
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FuturesTimeout:
+        metrics.increment("deadline.missed", stage=stage)
+        raise DeadlineExceeded(f"{stage} missed the turn deadline")
+
+class PendingAnswer:
+    """Consumes an answer stream in the background so it can outlive the chat turn"""
+
+    def __init__(self, text_stream):
+        self.id = uuid.uuid4().hex
+        self._chunks = []
+        self._cond = threading.Condition()
+        self.done = False
+        self.error = None
+        self.target = None  # (conversation id, message index) the answer is written to
+        self._on_finish = None
+        threading.Thread(target=self._run, args=(text_stream,), name="pending-answer", daemon=True).start()
+
+    def _run(self, text_stream):
+        try:
+            for chunk in text_stream:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+                callback = self._on_finish
+            if callback is not None:
+                callback(self)
+
+    def on_finish(self, callback):
+        """Call callback(job) once the answer is complete: right away if it already is, else from the job's thread"""
+        with self._cond:
+            if not self.done:
+                self._on_finish = callback
+                return
+        callback(self)
+
+    @property
+    def text(self):
+        with self._cond:
+            return "".join(self._chunks)
+
+    def iter_until(self, deadline):
+        """Yield chunks as they arrive; stop (without error) when the deadline passes"""
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self._chunks) and not self.done:
+                    remaining = deadline.remaining()
+                    if remaining <= 0:
+                        return
+                    self._cond.wait(timeout=remaining)
+                new_chunks = self._chunks[position:]
+                finished = self.done
+            for chunk in new_chunks:
+                yield chunk
+            position += len(new_chunks)
+            if finished and position >= len(self._chunks):
+                return
+
+def register_pending_answer(job, deliver, target):
+    """Have a late answer deliver itself when it finishes, whether or not its session is still around.
+
+    deliver(job) writes the answer to the saved conversation; target is its
+    (conversation id, message index). The job is forgotten once delivered.
+    """
+    job.target = target
+    with _pending_lock:
+        _PENDING_ANSWERS[job.id] = job
+    metrics.increment("deadline.pending_answers")
+
+    def finish(job):
+        try:
+            deliver(job)
+            debug_log(f"Pending answer {job.id[:8]} delivered")
+        except Exception as e:
+            debug_log(f"Pending answer {job.id[:8]} could not be delivered: {e}")
+            metrics.increment("deadline.undelivered")
+        finally:
+            with _pending_lock:
+                _PENDING_ANSWERS.pop(job.id, None)
+
+    job.on_finish(finish)
+
+def pending_answer_finished(job_id):
+    """True once the job has delivered its answer (or is no longer known to this process)"""
+    with _pending_lock:
+        return job_id not in _PENDING_ANSWERS
+
+def pending_answer_targets():
+    """(conversation id, message index) of every answer still generating in this process"""
+    with _pending_lock:
+        return {job.target for job in _PENDING_ANSWERS.values()}
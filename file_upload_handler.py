@@ -2,11 +2,23 @@
 file_upload_handler.py - Handle PDF file uploads and processing
 """
 import os
+import hashlib
 import tempfile
 import streamlit as st
 from session_manager import debug_log, reset_conversation_state
 from conversation_history import save_current_conversation
 from rag_chain_creator import create_rag_chain
+from scheduler import scheduled_llm
+from ai_models import get_task_llm
+from pdf_processor import extract_outline
+from section_summaries import start_summary_build
+from page_index import build_page_index
+from working_set import WorkingSet
+from vector_collections import (
+    create_collection, attach_collection, collection_name, session_key, release_session_collection
+)
+from course_library import list_courses, load_manifest
+from ann_index import HNSW_EF_SEARCH
 
 def process_file_upload(uploaded_file):
     """Process uploaded PDF file"""
@@ -26,10 +38,14 @@ def process_file_upload(uploaded_file):
         debug_log(f"Processing: {uploaded_file.name}")
         
         # Save uploaded file temporarily
+        file_bytes = uploaded_file.getvalue()
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
+            tmp_file.write(file_bytes)
             tmp_file_path = tmp_file.name
         
+        # Content hash: sessions on the same PDF share in-flight requests
+        document_fingerprint = hashlib.sha256(file_bytes).hexdigest()
+        
         st.write("Loading PDF...")
         progress_bar.progress(40)
         
@@ -44,12 +60,16 @@ def process_file_upload(uploaded_file):
             progress_bar.empty()
             return False
         
+        # Bookmarks drive the section summaries
+        outline = extract_outline(tmp_file_path)
+        
         st.write("Splitting text...")
         progress_bar.progress(60)
         
         # Split documents into chunks
         from langchain.text_splitter import RecursiveCharacterTextSplitter
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150)
+        # start_index lets retrieval merge overlapping chunks back together
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150, add_start_index=True)
         texts = text_splitter.split_documents(documents)
         
         if not texts:
@@ -63,24 +83,47 @@ def process_file_upload(uploaded_file):
         
         st.write("Building index...")
         
-        # Create vector store
-        from langchain_community.vectorstores import Chroma
-        st.session_state.vector_store = Chroma.from_documents(texts, st.session_state.embedding_model)
+        # Create vector store (the previous document's collection is deleted, not just dropped)
+        release_session_collection()
+        handle = create_collection(
+            texts, st.session_state.embedding_model, collection_name(session_key(), document_fingerprint),
+            fingerprint=document_fingerprint
+        )
+        st.session_state.collection_handle = handle
         progress_bar.progress(100)
         
         # Clean up temp file
         os.unlink(tmp_file_path)
         debug_log("Temp file deleted.")
         
-        # Update session state
+        # Update session state (an uploaded PDF replaces any course library picked before)
         st.session_state.processed_file_name = uploaded_file.name
-        st.session_state.rag_chain = create_rag_chain(st.session_state.vector_store, st.session_state.llm)
+        st.session_state.course_picker = "—"
+        st.session_state.document_fingerprint = document_fingerprint
+        st.session_state.rag_chain = create_rag_chain(
+            handle.store,
+            scheduled_llm(get_task_llm("answer"), st.session_state.username, "answer"),
+            fingerprint=document_fingerprint
+        )
+        handle.attach_chain(st.session_state.rag_chain)
+        
+        # Page/outline lookups for navigation questions
+        st.session_state.page_index = build_page_index(texts, outline, page_count=len(documents))
+        
+        # Section summaries are built once per document, in the background
+        start_summary_build(
+            document_fingerprint,
+            documents,
+            scheduled_llm(get_task_llm("summary"), st.session_state.username, "summary"),
+            outline
+        )
         
         # Reset conversation for new document
         greeting = f"Processed '{uploaded_file.name}'. Ask a question!"
         st.session_state.messages = [{"role": "assistant", "content": greeting}]
         st.session_state.current_conversation_id = None 
         st.session_state.loaded_convo_id = None
+        st.session_state.working_set = WorkingSet()
         st.session_state.prereq_history = set()
         st.session_state.check_prereqs = True
         debug_log("Reset check_prereqs to True after file upload")
@@ -105,9 +148,11 @@ def process_file_upload(uploaded_file):
         debug_log(f"Error in PDF processing: {e}")
         
         # Reset states on error
-        st.session_state.vector_store = None
+        release_session_collection()
         st.session_state.rag_chain = None
         st.session_state.processed_file_name = None
+        st.session_state.document_fingerprint = None
+        st.session_state.page_index = None
         
         # Clean up temp file if it exists
         if 'tmp_file_path' in locals() and os.path.exists(tmp_file_path):
@@ -115,6 +160,65 @@ def process_file_upload(uploaded_file):
         
         return False
 
+def attach_course(course):
+    """Attach the session to a course index pre-built by build_course_index.py"""
+    manifest = load_manifest(course)
+    if not manifest.get("index"):
+        st.error(f"Course '{course}' has not been indexed yet.")
+        return False
+    
+    debug_log(f"Attaching course library: {course}")
+    try:
+        release_session_collection()
+        handle = attach_collection(
+            collection_name(session_key(), manifest["fingerprint"]),
+            manifest["backend"] or "mapped",
+            {"path": manifest["index"], "ef_search": HNSW_EF_SEARCH},
+            st.session_state.embedding_model,
+            manifest["fingerprint"]
+        )
+    except Exception as e:
+        st.error(f"Error: {e}")
+        debug_log(f"Error attaching course {course}: {e}")
+        return False
+    
+    st.session_state.collection_handle = handle
+    st.session_state.processed_file_name = f"Course: {course}"
+    st.session_state.document_fingerprint = manifest["fingerprint"]
+    st.session_state.rag_chain = create_rag_chain(
+        handle.store,
+        scheduled_llm(get_task_llm("answer"), st.session_state.username, "answer"),
+        fingerprint=manifest["fingerprint"]
+    )
+    handle.attach_chain(st.session_state.rag_chain)
+    # Page numbers and outlines are per PDF, so a course has no page index or summary tree
+    st.session_state.page_index = None
+    
+    document_count = len(manifest["documents"])
+    greeting = f"Opened the '{course}' course library ({document_count} documents). Ask a question!"
+    st.session_state.messages = [{"role": "assistant", "content": greeting}]
+    st.session_state.current_conversation_id = None 
+    st.session_state.loaded_convo_id = None
+    st.session_state.working_set = WorkingSet()
+    st.session_state.prereq_history = set()
+    
+    save_current_conversation(st.session_state.username)
+    return True
+
+def display_course_picker():
+    """Offer the pre-built course libraries, if any"""
+    courses = list_courses()
+    if not courses:
+        return
+    
+    # Attached only when the selection changes: the selectbox keeps its value across reruns
+    st.selectbox("Or open a course library:", ["—"] + courses, key="course_picker", on_change=_on_course_picked)
+
+def _on_course_picked():
+    course = st.session_state.course_picker
+    if course != "—" and st.session_state.processed_file_name != f"Course: {course}":
+        attach_course(course)
+
 def display_file_upload_section():
     """Display the file upload section"""
     uploaded_file = st.file_uploader("Upload your course PDF here:", type="pdf", key="fileuploader")
@@ -123,5 +227,7 @@ def display_file_upload_section():
         success = process_file_upload(uploaded_file)
         # Don't call st.rerun() here - let the normal flow continue
         # The processing is complete and session state is updated
+    else:
+        display_course_picker()
     
     return uploaded_file
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+llm_client.py - Resilient wrapper around the chat model (timeouts, retries, concurrency cap, hedging)
+"""
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+import metrics
+from session_manager import debug_log
+
+# Process-wide cap on concurrent LLM calls, shared by every session
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+# Errors that will not go away by retrying (bad key, bad request, ...)
+NON_RETRYABLE_ERRORS = ("InvalidArgument", "PermissionDenied", "Unauthenticated", "NotFound", "ValueError")
+
+_LLM_SEMAPHORE = threading.BoundedSemaphore(MAX_CONCURRENT_LLM_CALLS)
+# Every submitted call holds a semaphore slot, so this pool never has to queue
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_LLM_CALLS, thread_name_prefix="llm")
+_in_flight_lock = threading.Lock()
+_in_flight = 0
+
+_STREAM_DONE = object()
+
+class LLMTimeoutError(TimeoutError):
+    """Raised when an LLM call (or the wait for a free slot) misses its deadline"""
+
+def _track_in_flight(delta):
+    global _in_flight
+    with _in_flight_lock:
+        _in_flight += delta
+        metrics.set_gauge("llm.in_flight", _in_flight)
+
+def _release_slot():
+    _track_in_flight(-1)
+    _LLM_SEMAPHORE.release()
+
+class ResilientLLM:
+    """Wrap any model exposing invoke(prompt) / stream(prompt).
+
+    Each call gets a deadline, transient failures are retried with
+    exponential backoff and jitter, and all calls share one process-wide
+    semaphore. With hedge_after set, a duplicate request is fired when the
+    first one is still pending after that many seconds and the first answer
+    wins; for streams, the first stream to produce a chunk wins. Works with
+    any local fake model that has the same two methods.
+    """
+
+    def __init__(self, model, name="llm", task="default", timeout=60.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, hedge_after=None):
+        self.model = model
+        self.name = name
+        self.task = task
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+
+    def __getattr__(self, attr):
+        # Anything we don't wrap is served by the underlying model
+        return getattr(self.model, attr)
+
+    def _acquire_slot(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not _LLM_SEMAPHORE.acquire(timeout=remaining):
+            raise LLMTimeoutError(f"{self.name}: no free LLM slot before the deadline")
+        _track_in_flight(1)
+
+    def _submit(self, fn, *args):
+        """Run fn on the LLM pool; the caller must already hold a slot"""
+        future = _EXECUTOR.submit(fn, *args)
+        future.add_done_callback(lambda _: _release_slot())
+        return future
+
+    def _should_retry(self, error, attempt, deadline):
+        if attempt >= self.max_retries:
+            return False
+        if type(error).__name__ in NON_RETRYABLE_ERRORS:
+            return False
+        return deadline - time.monotonic() > 0
+
+    def _backoff(self, attempt, deadline):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        delay = min(delay, max(0.0, deadline - time.monotonic()))
+        metrics.increment("llm.retries", model=self.name, task=self.task)
+        time.sleep(delay)
+
+    def _invoke_once(self, prompt, deadline):
+        self._acquire_slot(deadline)
+        futures = [self._submit(self.model.invoke, prompt)]
+
+        if self.hedge_after is not None:
+            done, _ = wait(futures, timeout=max(0.0, min(self.hedge_after, deadline - time.monotonic())))
+            if not done and _LLM_SEMAPHORE.acquire(blocking=False):
+                _track_in_flight(1)
+                debug_log(f"{self.name}: hedging slow LLM request")
+                metrics.increment("llm.hedges", model=self.name, task=self.task)
+                futures.append(self._submit(self.model.invoke, prompt))
+
+        last_error = None
+        try:
+            for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                try:
+                    return future.result()
+                except Exception as e:
+                    # Keep waiting for the other hedge, if any
+                    last_error = e
+        except TimeoutError:
+            raise LLMTimeoutError(f"{self.name}: LLM call exceeded its deadline")
+        raise last_error
+
+    def invoke(self, prompt, timeout=None):
+        """Blocking call with deadline, retries and optional hedging"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                response = self._invoke_once(prompt, deadline)
+                metrics.increment("llm.calls", model=self.name, task=self.task, outcome="ok")
+                metrics.observe("llm.latency", time.monotonic() - started, model=self.name, task=self.task)
+                return response
+            except Exception as e:
+                if not isinstance(e, LLMTimeoutError) and self._should_retry(e, attempt, deadline):
+                    debug_log(f"{self.name}: LLM call failed ({e}), retry {attempt + 1}/{self.max_retries}")
+                    self._backoff(attempt, deadline)
+                    attempt += 1
+                    continue
+                outcome = "timeout" if isinstance(e, LLMTimeoutError) else "error"
+                metrics.increment("llm.calls", model=self.name, task=self.task, outcome=outcome)
+                raise
+
+    def _start_pump(self, prompt, chunks, pump_id):
+        """Stream from the model on the LLM pool into chunks as (pump_id, chunk, error); returns its stop event"""
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in self.model.stream(prompt):
+                    if stop.is_set():
+                        return
+                    chunks.put((pump_id, chunk, None))
+                chunks.put((pump_id, _STREAM_DONE, None))
+            except Exception as e:
+                chunks.put((pump_id, None, e))
+
+        self._submit(pump)
+        return stop
+
+    def _stream_once(self, prompt, deadline):
+        """One streaming attempt. With hedge_after set, a duplicate stream is started if no chunk
+        has arrived by then; the first stream to produce a chunk is followed and the other stopped."""
+        self._acquire_slot(deadline)
+        chunks = queue.Queue()
+        stops = [self._start_pump(prompt, chunks, 0)]
+        hedge_at = time.monotonic() + self.hedge_after if self.hedge_after is not None else None
+        running = 1
+        winner = None
+        try:
+            while True:
+                wait_until = deadline if hedge_at is None else min(deadline, hedge_at)
+                try:
+                    pump_id, chunk, error = chunks.get(timeout=max(0.0, wait_until - time.monotonic()))
+                except queue.Empty:
+                    if hedge_at is None or time.monotonic() >= deadline:
+                        raise LLMTimeoutError(f"{self.name}: LLM stream exceeded its deadline")
+                    hedge_at = None
+                    if _LLM_SEMAPHORE.acquire(blocking=False):
+                        _track_in_flight(1)
+                        debug_log(f"{self.name}: hedging slow LLM stream")
+                        metrics.increment("llm.hedges", model=self.name, task=self.task)
+                        stops.append(self._start_pump(prompt, chunks, len(stops)))
+                        running += 1
+                    continue
+                if winner is not None and pump_id != winner:
+                    continue
+                if error is not None:
+                    running -= 1
+                    if winner is None and running:
+                        continue  # the other stream may still answer
+                    raise error
+                if winner is None:
+                    # First chunk decides; no hedge is started after this
+                    winner = pump_id
+                    hedge_at = None
+                    for other, stop in enumerate(stops):
+                        if other != winner:
+                            stop.set()
+                if chunk is _STREAM_DONE:
+                    return
+                yield chunk
+        finally:
+            # Also reached when the consumer stops early: let the pumps give their slots back
+            for stop in stops:
+                stop.set()
+
+    def stream(self, prompt, timeout=None):
+        """Streaming call with deadline and optional hedging of the first chunk; retried only if it fails before the first chunk"""
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            yielded = False
+            try:
+                for chunk in self._stream_once(prompt, deadline):
+                    yielded = True
+                    yield chunk
+                metrics.increment("llm.calls", model=self.name, task=self.task, outcome="ok")
+                metrics.observe("llm.latency", time.monotonic() - started, model=self.name, task=self.task)
+                return
+            except Exception as e:
+                if (not yielded and not isinstance(e, LLMTimeoutError)
+                        and self._should_retry(e, attempt, deadline)):
+                    debug_log(f"{self.name}: LLM stream failed ({e}), retry {attempt + 1}/{self.max_retries}")
+                    self._backoff(attempt, deadline)
+                    attempt += 1
+                    continue
+                outcome = "timeout" if isinstance(e, LLMTimeoutError) else "error"
+                metrics.increment("llm.calls", model=self.name, task=self.task, outcome=outcome)
+                raise
@@ -37,6 +37,9 @@ from chat_handler import (
     display_context_caption
 )
 from study_notes_generator import display_study_notes_generator, display_notes_modal
+import metrics
+from vector_collections import live_collections
+from memory_governor import record_session_activity, session_memory_report
 
 # Page configuration (must be first Streamlit command)
 st.set_page_config(page_title="AI Educational Chatbot", page_icon="🎓", layout="wide")
@@ -53,6 +56,9 @@ if not google_api_key:
 # Initialize session state
 initialize_session_state()
 
+# Memory accounting; idle sessions' indexes are moved to disk when over budget
+record_session_activity()
+
 # Main app title
 st.title("🎓 AI Educational Chatbot")
 
@@ -114,5 +120,9 @@ if os.getenv("DEBUG") == "true":
         st.write("Authenticated:", is_user_authenticated())
         st.write("Username:", get_current_username())
         st.write("RAG Chain:", bool(st.session_state.rag_chain))
-        st.write("Vector Store:", bool(st.session_state.vector_store))
-        st.write("Processed File:", st.session_state.processed_file_name)
\ No newline at end of file
+        handle = st.session_state.collection_handle
+        st.write("Vector Store:", "on disk" if handle and handle.evicted else bool(handle))
+        st.write("Processed File:", st.session_state.processed_file_name)
+        st.write("Vector Collections:", live_collections())
+        st.write("Session Memory:", session_memory_report())
+        st.write("Metrics:", metrics.snapshot())
\ No newline at end of file
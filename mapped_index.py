@@ -0,0 +1,178 @@
+"""
+mapped_index.py - Flat on-disk index files opened read-only with numpy.memmap and shared between processes
+"""
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+import weakref
+import numpy as np
+from langchain_core.documents import Document
+from session_manager import debug_log
+from numpy_vector_store import NumpyVectorStore, VECTOR_PRECISION, PCA_DIMENSIONS, RESCORE_FACTOR
+from vector_compression import VectorCodec, normalize_rows
+
+# Bump when the file layout changes; older directories are rebuilt
+INDEX_FORMAT_VERSION = 2
+# Root of the per-document index directories
+INDEX_STORE_DIR = os.getenv("INDEX_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "index_store"))
+
+EMBEDDINGS_FILE = "embeddings.f32"  # n x d float32, unit rows (exact search, or rescoring when encoded)
+ENCODED_FILE = "encoded.bin"  # n x d' rows encoded by the codec, only when the encoding is lossy
+CODEC_FILE = "codec.npz"  # PCA mean/components and int8 scales, only when the encoding is lossy
+OFFSETS_FILE = "offsets.i64"  # n + 1 byte offsets into the text blob
+TEXTS_FILE = "texts.bin"  # UTF-8 chunk texts back to back
+META_FILE = "meta.json"  # format version, shape, embedding model, per-chunk metadata
+
+_open_lock = threading.Lock()
+_OPEN_INDEXES = weakref.WeakValueDictionary()  # path -> MappedIndex, one mapping per process
+
+def embedding_model_name(embedding_model):
+    return getattr(embedding_model, "model_name", None) or type(embedding_model).__name__
+
+def index_path(fingerprint, embedding_model):
+    """Directory of a document's index for one embedding model"""
+    model_slug = re.sub(r"[^A-Za-z0-9._-]+", "-", embedding_model_name(embedding_model))
+    return os.path.join(INDEX_STORE_DIR, f"{fingerprint[:32]}-{model_slug}")
+
+def index_exists(path):
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as meta_file:
+            return json.load(meta_file).get("version") == INDEX_FORMAT_VERSION
+    except (OSError, ValueError):
+        return False
+
+def write_index(path, texts, metadatas, vectors, model_name, precision=VECTOR_PRECISION, pca_dimensions=PCA_DIMENSIONS):
+    """Write an index directory atomically; if another process won the race its copy is kept"""
+    vectors = normalize_rows(vectors)
+    codec = VectorCodec(precision, pca_dimensions)
+    if len(vectors):
+        codec.fit(vectors)
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(blob) for blob in encoded], out=offsets[1:])
+
+    staging = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    os.makedirs(staging)
+    vectors.tofile(os.path.join(staging, EMBEDDINGS_FILE))
+    if len(vectors) and not codec.lossless:
+        encoded_vectors = codec.encode(vectors)
+        encoded_vectors.tofile(os.path.join(staging, ENCODED_FILE))
+        np.savez(os.path.join(staging, CODEC_FILE), **{
+            name: array for name, array in
+            (("mean", codec.mean), ("components", codec.components), ("scale", codec.scale)) if array is not None
+        })
+    offsets.tofile(os.path.join(staging, OFFSETS_FILE))
+    with open(os.path.join(staging, TEXTS_FILE), "wb") as texts_file:
+        texts_file.write(b"".join(encoded))
+    with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as meta_file:
+        json.dump({
+            "version": INDEX_FORMAT_VERSION,
+            "count": len(texts),
+            "dimensions": int(vectors.shape[1]),
+            "precision": precision,
+            "encoded_dimensions": int(encoded_vectors.shape[1]) if len(vectors) and not codec.lossless else None,
+            "embedding_model": model_name,
+            "metadatas": metadatas,
+        }, meta_file)
+
+    if os.path.isdir(path) and not index_exists(path):
+        shutil.rmtree(path, ignore_errors=True)  # stale format
+    try:
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        if not index_exists(path):
+            raise
+    debug_log(f"Wrote index {os.path.basename(path)} ({len(texts)} chunks)")
+
+class MappedIndex:
+    """Read-only view of an index directory; the OS page cache holds the only copy of the data"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        self.count = meta["count"]
+        self.dimensions = meta["dimensions"]
+        self.metadatas = meta["metadatas"]
+        self.embeddings = np.memmap(
+            os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=(self.count, self.dimensions)
+        )
+        self.codec, self.encoded = self._open_encoded(path, meta)
+        self.offsets = np.memmap(os.path.join(path, OFFSETS_FILE), dtype=np.int64, mode="r", shape=(self.count + 1,))
+        texts_path = os.path.join(path, TEXTS_FILE)
+        # memmap cannot map an empty file
+        self.texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if os.path.getsize(texts_path) else b""
+
+    def _open_encoded(self, path, meta):
+        """The codec and its encoded rows, or (float32 codec, None) when the embeddings are searched directly"""
+        codec = VectorCodec(meta["precision"])
+        if meta["encoded_dimensions"] is None:
+            return codec, None
+        with np.load(os.path.join(path, CODEC_FILE), allow_pickle=False) as params:
+            codec.mean = params["mean"] if "mean" in params else None
+            codec.components = params["components"] if "components" in params else None
+            codec.scale = params["scale"] if "scale" in params else None
+        encoded = np.memmap(
+            os.path.join(path, ENCODED_FILE), dtype=np.dtype(meta["precision"]), mode="r",
+            shape=(self.count, meta["encoded_dimensions"])
+        )
+        return codec, encoded
+
+    @property
+    def file_bytes(self):
+        encoded_bytes = self.encoded.nbytes if self.encoded is not None else 0
+        return self.embeddings.nbytes + encoded_bytes + self.offsets.nbytes + len(self.texts)
+
+    def text(self, row):
+        return bytes(self.texts[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+
+def open_index(path):
+    """Open (or reuse this process's mapping of) an index directory"""
+    with _open_lock:
+        index = _OPEN_INDEXES.get(path)
+        if index is None:
+            index = MappedIndex(path)
+            _OPEN_INDEXES[path] = index
+        return index
+
+class MappedVectorStore(NumpyVectorStore):
+    """NumpyVectorStore searching a memory-mapped index in place (read-only).
+
+    Scans the encoded rows written with the index's precision and rescores
+    the candidates from the mapped float32 file, like the in-memory store.
+    """
+
+    def __init__(self, embedding, index, rescore_factor=RESCORE_FACTOR):
+        self._embedding = embedding
+        self.index = index
+        self.codec = index.codec
+        if index.encoded is not None:
+            self._vectors = index.encoded
+            self._full = index.embeddings
+            self.rescore_factor = rescore_factor
+        else:
+            self._vectors = index.embeddings if index.count else None
+            self._full = None
+            self.rescore_factor = 0
+        self._ids = [str(i) for i in range(index.count)]
+
+    def __len__(self):
+        return self.index.count
+
+    @property
+    def nbytes(self):
+        """Per-session memory only; the mapped files are shared through the page cache"""
+        return len(json.dumps(self.index.metadatas))
+
+    def _document(self, row):
+        return Document(id=str(row), page_content=self.index.text(row), metadata=dict(self.index.metadatas[row]))
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        raise NotImplementedError("Mapped indexes are read-only; write a new index with write_index()")
+
+    def export(self):
+        return {"path": self.index.path}
@@ -0,0 +1,134 @@
+"""
+memory_governor.py - Per-session memory accounting, a global budget, and eviction of idle sessions' indexes
+"""
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+import streamlit as st
+import metrics
+from session_manager import debug_log
+from vector_collections import session_key, live_collections
+
+# Memory the sessions of this process may hold before idle indexes are evicted
+MEMORY_BUDGET_MB = float(os.getenv("MEMORY_BUDGET_MB", "1024"))
+# Sessions idle this long always have their index moved to disk
+IDLE_EVICTION_SECONDS = float(os.getenv("IDLE_EVICTION_SECONDS", "900"))
+# Sessions active more recently than this are never evicted, even over budget (a session in the
+# middle of a chat turn is never evicted, however long the turn takes: see session_turn)
+MIN_IDLE_SECONDS = 60
+
+class _SessionToken:
+    """Lives in one session's state; when it is collected the session is gone"""
+
+_lock = threading.Lock()
+_SESSIONS = {}  # session key -> {"token": weakref, "handle": weakref, "last_active": t, "other_bytes": n}
+
+def _text_bytes(text):
+    return len(text.encode("utf-8")) if text else 0
+
+def estimate_session_bytes(state):
+    """Approximate memory held by a session outside its vector index"""
+    total = sum(_text_bytes(message["content"]) for message in state.get("messages") or [])
+
+    page_index = state.get("page_index")
+    if page_index:
+        total += sum(_text_bytes(chunk.page_content) for chunks in page_index["pages"].values() for chunk in chunks)
+
+    working_set = state.get("working_set")
+    if working_set is not None:
+        total += working_set.nbytes
+    return total
+
+def _index_bytes(handle, live):
+    if handle is None or handle.evicted:
+        return 0
+    return live.get(handle.name, {}).get("bytes", 0)
+
+def record_session_activity():
+    """Account this session's memory, mark it active, then enforce the budget for the process"""
+    key = session_key()
+    if "memory_token" not in st.session_state:
+        st.session_state.memory_token = _SessionToken()
+    handle = st.session_state.get("collection_handle")
+
+    with _lock:
+        _SESSIONS[key] = {
+            "token": weakref.ref(st.session_state.memory_token),
+            "handle": weakref.ref(handle) if handle is not None else None,
+            "last_active": time.monotonic(),
+            "other_bytes": estimate_session_bytes(st.session_state),
+        }
+    enforce_memory_budget(live_collections())
+
+def enforce_memory_budget(live):
+    """Move idle sessions' indexes to disk: all long-idle ones, then least recently used while over budget"""
+    now = time.monotonic()
+    budget = MEMORY_BUDGET_MB * 1024 * 1024
+    with _lock:
+        for key in [key for key, session in _SESSIONS.items() if session["token"]() is None]:
+            del _SESSIONS[key]  # session ended
+        sessions = [
+            (session["last_active"], session["handle"]() if session["handle"] else None, session["other_bytes"])
+            for session in _SESSIONS.values()
+        ]
+
+    total = sum(_index_bytes(handle, live) + other_bytes for _, handle, other_bytes in sessions)
+    evictable = sorted(
+        (last_active, handle) for last_active, handle, _ in sessions
+        if handle is not None and not handle.evicted and not handle.pins and now - last_active >= MIN_IDLE_SECONDS
+    )
+    for last_active, handle in evictable:
+        idle_seconds = now - last_active
+        if idle_seconds < IDLE_EVICTION_SECONDS and total <= budget:
+            break
+        debug_log(f"Evicting index {handle.name} (idle {idle_seconds:.0f}s, total {total // 1024} KiB)")
+        total -= handle.evict()
+
+    metrics.set_gauge("memory.sessions", len(sessions))
+    metrics.set_gauge("memory.total_bytes", total)
+    metrics.set_gauge("memory.budget_bytes", int(budget))
+    return total
+
+@contextmanager
+def session_turn():
+    """Keep the session's index in memory from the start to the end of a chat turn"""
+    handle = st.session_state.get("collection_handle")
+    if handle is not None:
+        handle.pin()
+    try:
+        yield
+    finally:
+        if handle is not None:
+            handle.unpin()
+        with _lock:
+            session = _SESSIONS.get(session_key())
+            if session is not None:
+                session["last_active"] = time.monotonic()
+
+def ensure_session_index():
+    """Make sure the session's index is in memory before a question is answered"""
+    handle = st.session_state.get("collection_handle")
+    rag_chain = st.session_state.get("rag_chain")
+    if handle is None or rag_chain is None:
+        return
+    store = handle.ensure_loaded()
+    if store is not None and rag_chain.db is not store:
+        handle.attach_chain(rag_chain)
+
+def session_memory_report():
+    """Session key -> memory estimate, for the debug panel"""
+    live = live_collections()
+    now = time.monotonic()
+    with _lock:
+        report = {}
+        for key, session in _SESSIONS.items():
+            handle = session["handle"]() if session["handle"] else None
+            report[key[:8]] = {
+                "idle_seconds": round(now - session["last_active"]),
+                "index_bytes": _index_bytes(handle, live),
+                "index_on_disk": bool(handle and handle.evicted),
+                "other_bytes": session["other_bytes"],
+            }
+        return report
@@ -0,0 +1,64 @@
+"""
+metrics.py - Lightweight in-process metrics (counters, latencies and gauges)
+"""
+import threading
+from collections import defaultdict, deque
+
+# Number of latency samples kept per series
+MAX_SAMPLES = 500
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_gauges = {}
+
+def _series(name, labels):
+    """Build a series name like 'llm.calls{task=answer}'"""
+    if not labels:
+        return name
+    label_text = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_text}}}"
+
+def increment(name, value=1, **labels):
+    """Increase a counter"""
+    with _lock:
+        _counters[_series(name, labels)] += value
+
+def observe(name, seconds, **labels):
+    """Record a latency sample in seconds"""
+    with _lock:
+        _timings[_series(name, labels)].append(seconds)
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[_series(name, labels)] = value
+
+def _percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def snapshot():
+    """Return a plain dict of all metrics, suitable for st.write or json.dumps"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: sorted(samples) for name, samples in _timings.items() if samples}
+
+    latencies = {}
+    for name, samples in timings.items():
+        latencies[name] = {
+            "count": len(samples),
+            "p50_ms": round(_percentile(samples, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(samples, 0.95) * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+
+    return {"counters": counters, "gauges": gauges, "latencies": latencies}
+
+def reset():
+    """Clear all metrics"""
+    with _lock:
+        _counters.clear()
+        _timings.clear()
+        _gauges.clear()
@@ -3,7 +3,7 @@ migrate_database.py - Run this script to migrate data from JSON to SQLite
 """
 import os
 import sys
-from database_manager import initialize_database, migrate_from_json
+from database_manager import initialize_database, migrate_from_json, apply_migrations, schema_version
 
 def main():
     print("Starting database migration...")
@@ -22,6 +22,13 @@ def main():
         print("Data migration failed.")
         sys.exit(1)
     
+    # Bring the schema up to date
+    if apply_migrations():
+        print(f"Database schema is at version {schema_version()}.")
+    else:
+        print("Schema migration failed.")
+        sys.exit(1)
+    
     print("Migration complete! Your application is now using SQLite for storage.")
     print("You can safely delete the user_database.json file and the conversation_histories folder after confirming everything works correctly.")
 
@@ -0,0 +1,170 @@
+"""
+numpy_vector_store.py - Brute-force in-memory vector search over one contiguous (optionally compressed) matrix
+"""
+import os
+import uuid
+import weakref
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from private_dirs import private_dir
+from vector_compression import VectorCodec, normalize_rows
+
+# float32 (exact), float16 or int8
+VECTOR_PRECISION = os.getenv("VECTOR_PRECISION", "int8")
+# Learn a per-document PCA down to this many dimensions (0 = off)
+PCA_DIMENSIONS = int(os.getenv("VECTOR_PCA_DIMENSIONS", "0"))
+# Candidates rescored at full precision per result (0 = no rescoring)
+RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# Full-precision copies for rescoring are memory-mapped from here; only candidate rows are read
+# (default: a private temporary directory per process)
+RESCORE_DIR = os.getenv("VECTOR_RESCORE_DIR")
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.unlink(path)
+
+class NumpyVectorStore(VectorStore):
+    """Brute-force cosine search; chunk texts and metadata live in lists parallel to the matrix rows.
+
+    Scores follow Chroma's contract (squared L2 distance, lower is closer). They
+    only match Chroma's because the embedding model returns unit vectors
+    (ai_models.EMBEDDING_ENCODE_KWARGS); this store normalizes either way.
+    """
+
+    def __init__(self, embedding, vectors=None, texts=None, metadatas=None, ids=None,
+                 precision=VECTOR_PRECISION, pca_dimensions=PCA_DIMENSIONS, rescore_factor=RESCORE_FACTOR):
+        self._embedding = embedding
+        self._texts = list(texts or [])
+        self._metadatas = list(metadatas) if metadatas is not None else [{} for _ in self._texts]
+        self._ids = list(ids) if ids is not None else [str(i) for i in range(len(self._texts))]
+        self.codec = VectorCodec(precision, pca_dimensions)
+        self.rescore_factor = rescore_factor
+        self._vectors = None  # encoded rows
+        self._full = None  # float32 memmap of the exact vectors, only when the encoding is lossy
+        if vectors is not None and self._texts:
+            self._set_vectors(normalize_rows(vectors))
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self._texts)
+
+    @property
+    def nbytes(self):
+        """Memory held by the encoded vectors, codec and chunk texts (the rescoring copy is on disk)"""
+        vector_bytes = self._vectors.nbytes if self._vectors is not None else 0
+        return vector_bytes + self.codec.nbytes + sum(len(text.encode("utf-8")) for text in self._texts)
+
+    def _full_vectors(self):
+        if self._vectors is None:
+            return None
+        if self.codec.lossless:
+            return self._vectors
+        return np.asarray(self._full)
+
+    def _set_vectors(self, full):
+        self.codec.fit(full)
+        self._vectors = self.codec.encode(full)
+        self._full = None
+        if not self.codec.lossless:
+            path = os.path.join(private_dir(RESCORE_DIR, "chatbot_rescore-"), f"{uuid.uuid4().hex}.f32")
+            disk_copy = np.memmap(path, dtype=np.float32, mode="w+", shape=full.shape)
+            disk_copy[:] = full
+            disk_copy.flush()
+            del disk_copy
+            self._full = np.memmap(path, dtype=np.float32, mode="r", shape=full.shape)
+            if os.name == "posix":
+                # The mapping outlives the name, so a crash leaves nothing behind
+                os.unlink(path)
+            else:
+                weakref.finalize(self._full, _remove_file, path)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(len(self._texts) + i) for i in range(len(texts))]
+        vectors = normalize_rows(self._embedding.embed_documents(texts))
+        existing = self._full_vectors()
+        if existing is not None:
+            vectors = np.vstack([existing, vectors])
+        # The codec is refit on every row; uploads add a document's chunks in one call
+        self._set_vectors(vectors)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._ids.extend(ids)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def _top_k(self, query_vector, k):
+        """(row, cosine similarity) of the k best rows, best first"""
+        if self._vectors is None:
+            return []
+        query = normalize_rows(query_vector)[0]
+        scores = self.codec.scores(self._vectors, query)
+        rescore = self._full is not None and self.rescore_factor > 0
+        n_candidates = min(len(scores), k * self.rescore_factor if rescore else k)
+        if n_candidates < len(scores):
+            top = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        else:
+            top = np.arange(len(scores))
+        if rescore:
+            # Rescore the compressed search's candidates with the exact vectors
+            top = np.sort(top)
+            scores = np.zeros(len(scores), dtype=np.float32)
+            scores[top] = self._full[top] @ query
+        top = top[np.argsort(-scores[top])][:k]
+        return [(int(row), float(scores[row])) for row in top]
+
+    def _document(self, row):
+        # The row is the document id, so vectors_for can find the stored vector again
+        return Document(id=str(row), page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def vectors_for(self, docs):
+        """Stored full-precision unit vectors of documents this store returned, or None if any is not one of its rows"""
+        if self._vectors is None:
+            return None
+        try:
+            rows = [int(doc.id) for doc in docs]
+        except (TypeError, ValueError):
+            return None
+        if any(row < 0 or row >= len(self) for row in rows):
+            return None
+        if self.codec.lossless:
+            return np.asarray(self._vectors[rows])
+        return np.asarray(self._full[rows])
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        # Squared L2 distance between unit vectors, like Chroma's default space
+        return [(self._document(row), 2.0 - 2.0 * score) for row, score in self._top_k(embedding, k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [self._document(row) for row, _ in self._top_k(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k)
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def export(self):
+        """Plain data (with full-precision vectors) for spilling to disk"""
+        full = self._full_vectors()
+        return {
+            "ids": self._ids,
+            "embeddings": np.array(full, dtype=np.float32) if full is not None else None,
+            "documents": self._texts,
+            "metadatas": self._metadatas,
+        }
@@ -0,0 +1,121 @@
+"""
+page_index.py - Page -> chunk and outline -> page lookup for direct navigation queries
+"""
+import re
+import metrics
+from session_manager import debug_log
+
+# Longest text returned for one navigation request
+MAX_NAVIGATION_CHARS = 4000
+
+NAVIGATION_PATTERN = re.compile(
+    r"^\s*(?:please\s+)?"
+    r"(?:(?:show|open|display|read|print|go to|jump to|take me to|give me|what'?s on|what is on|whats on)\s+)?"
+    r"(?:me\s+)?(?:the\s+)?(?:(?:text|content|contents)\s+(?:of|on|from)\s+)?"
+    r"(page|pages|section|chapter)\s+(\d+(?:\.\d+)*)(?:\s*(?:-|to)\s*(\d+))?"
+    r"(?:\s+(?:please|say|contain|contains))?\s*[?.!]*\s*$"
+)
+
+def build_page_index(chunks, outline=None, page_count=None):
+    """Index chunks by page (in reading order) and keep the outline for section lookups"""
+    pages = {}
+    for chunk in chunks:
+        page = chunk.metadata.get("page", -1)
+        if page < 0:
+            continue
+        pages.setdefault(page, []).append(chunk)
+    for page_chunks in pages.values():
+        page_chunks.sort(key=lambda chunk: chunk.metadata.get("start_index", 0))
+
+    if page_count is None:
+        page_count = max(pages) + 1 if pages else 0
+    return {"pages": pages, "outline": sorted(outline or [], key=lambda e: e["page"]), "page_count": page_count}
+
+def parse_navigation_query(query):
+    """Return ('page', first, last) or ('section', number) for navigation requests, else None"""
+    match = NAVIGATION_PATTERN.match(query.lower())
+    if not match:
+        return None
+    kind, target, until = match.groups()
+    if kind in ("page", "pages"):
+        if "." in target:
+            return None
+        first = int(target)
+        last = int(until) if until else first
+        return ("page", min(first, last), max(first, last))
+    return ("section", target)
+
+def _page_text(page_chunks):
+    """Stitch a page's overlapping chunks back into one text"""
+    text = ""
+    end = 0
+    for chunk in page_chunks:
+        start = chunk.metadata.get("start_index")
+        content = chunk.page_content
+        if start is None:
+            text += ("\n" if text else "") + content
+            continue
+        chunk_end = start + len(content)
+        if chunk_end <= end:
+            continue
+        if text and start < end:
+            text += content[end - start:]
+        else:
+            text += ("\n" if text else "") + content
+        end = chunk_end
+    return text
+
+def _render_pages(index, first, last):
+    parts = []
+    for page in range(first, last + 1):
+        page_chunks = index["pages"].get(page - 1)
+        if page_chunks:
+            parts.append(f"**Page {page}**\n\n{_page_text(page_chunks)}")
+    text = "\n\n---\n\n".join(parts)
+    if len(text) > MAX_NAVIGATION_CHARS:
+        text = text[:MAX_NAVIGATION_CHARS].rstrip() + "\n\n*(truncated)*"
+    return text
+
+def _find_section(index, number):
+    """Find an outline entry by number ('2.3', or the n-th chapter), returning (entry, last_page)"""
+    outline = index["outline"]
+    pattern = re.compile(rf"^(?:chapter|section|part|unit)?\s*{re.escape(number)}(?![\d])", re.IGNORECASE)
+    matches = [i for i, entry in enumerate(outline) if pattern.match(entry["title"])]
+    if not matches and "." not in number:
+        top_level = [i for i, entry in enumerate(outline) if entry["level"] == 0]
+        if 0 < int(number) <= len(top_level):
+            matches = [top_level[int(number) - 1]]
+    if not matches:
+        return None, None
+
+    position = matches[0]
+    entry = outline[position]
+    last_page = index["page_count"] - 1
+    for following in outline[position + 1:]:
+        if following["level"] <= entry["level"] and following["page"] > entry["page"]:
+            last_page = following["page"] - 1
+            break
+    return entry, max(entry["page"], last_page)
+
+def answer_navigation_query(query, index):
+    """Serve a navigation request straight from the index; None if it isn't one"""
+    request = parse_navigation_query(query)
+    if request is None or not index:
+        return None
+
+    metrics.increment("navigation.queries", kind=request[0])
+    if request[0] == "page":
+        _, first, last = request
+        debug_log(f"Navigation: pages {first}-{last}")
+        if first < 1 or first > index["page_count"]:
+            return f"Page {first} is not in this document (it has {index['page_count']} pages)."
+        last = min(last, index["page_count"])
+        text = _render_pages(index, first, last)
+        return text or f"No text could be extracted from page {first}."
+
+    entry, last_page = _find_section(index, request[1])
+    debug_log(f"Navigation: section {request[1]} -> {entry}")
+    if entry is None:
+        return f"I couldn't find section {request[1]} in this document's outline."
+    header = f"**{entry['title']}** (pages {entry['page'] + 1}-{last_page + 1})"
+    return f"{header}\n\n{_render_pages(index, entry['page'] + 1, last_page + 1)}"
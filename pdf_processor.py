@@ -25,7 +25,7 @@ def process_uploaded_pdf(uploaded_file):
             os.unlink(tmp_file_path)
             return None
         
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=150, add_start_index=True)
         texts = text_splitter.split_documents(documents)
         
         if not texts: 
@@ -50,4 +50,29 @@ def get_raw_document_text(source_docs):
      raw_text = "\n\n".join([doc.page_content for doc in source_docs])
      pages = sorted(list(set([doc.metadata.get('page', -1) + 1 for doc in source_docs if doc.metadata.get('page', -1) != -1])))
      page_info = f"Found on page(s): {', '.join(map(str, pages))}" if pages else "Page info unavailable."
-     return f"Relevant text:\n\n---\n{raw_text}\n---\n\n{page_info}"
\ No newline at end of file
+     return f"Relevant text:\n\n---\n{raw_text}\n---\n\n{page_info}"
+
+def extract_outline(pdf_path):
+     """Return the PDF bookmarks as [{'title', 'level', 'page'}] (0-based pages, like chunk metadata)"""
+     try:
+          from pypdf import PdfReader
+          reader = PdfReader(pdf_path)
+          outline = reader.outline
+     except Exception as e:
+          print(f"Outline Error: {e}", file=sys.stderr)
+          return []
+
+     entries = []
+     def walk(items, level):
+          for item in items:
+               if isinstance(item, list):
+                    walk(item, level + 1)
+                    continue
+               try:
+                    page = reader.get_destination_page_number(item)
+               except Exception:
+                    continue
+               if page is not None and page >= 0:
+                    entries.append({"title": str(item.title).strip(), "level": level, "page": page})
+     walk(outline, 0)
+     return entries
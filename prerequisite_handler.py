@@ -1,13 +1,17 @@
 import streamlit as st
+from ai_models import stream_llm_text
+from singleflight import LLM_FLIGHTS, make_flight_key
+from scheduler import SchedulerBusyError, BUSY_MESSAGE
+from deadlines import Deadline
 
-def detect_prerequisites(query, llm):
+def detect_prerequisites(query, llm, timeout=None):
     if not llm: return None
     print(f"DEBUG: Detecting prerequisites for: {query}")
     prompt = """Examine the following question related to educational content. Based on the question, determine if there's a prerequisite topic that the student likely needs to understand first before comprehending the answer. 
 
 Question: "{query}"
 
-First, analyze what topics are directly asked about in the question. Then, determine the most fundamental concept that is DIRECTLY RELATED to this question and is necessary to understand before the original question can be properly understood.
+Determine the most fundamental concept that is DIRECTLY RELATED to this question and is necessary to understand before the original question can be properly understood. Do not write out your analysis: reply with the verdict only.
 
 Important rules:
 1. The prerequisite MUST be closely and directly related to the original question
@@ -25,8 +29,13 @@ Examples of good outputs:
 Output ONLY the prerequisite topic name or "None". Keep it concise - max 5 words."""
 
     try:
-        response = llm.invoke(prompt.format(query=query))
-        response_text = response.content.strip()
+        # Identical questions from many sessions share one LLM call
+        key = make_flight_key(None, query, "prereq-detect")
+        invoke_kwargs = {"timeout": timeout} if timeout is not None else {}
+        deadline = Deadline(timeout) if timeout is not None else None
+        response_text = LLM_FLIGHTS.do(
+            key, lambda: llm.invoke(prompt.format(query=query), **invoke_kwargs).content, deadline
+        ).strip()
         print(f"DEBUG (detect_prereq response): {response_text}")
         
         # Clean up response to handle cases where model outputs "Prerequisite: None"
@@ -49,11 +58,8 @@ Output ONLY the prerequisite topic name or "None". Keep it concise - max 5 words
         print(f"Error detecting prerequisites: {e}")
         return None
 
-def explain_prerequisite(topic, llm):
-    if not topic or not llm: return f"Couldn't find info: '{topic}'."
-    print(f"DEBUG: Explaining prerequisite: {topic}")
-    
-    prompt = f"""Provide a clear, concise explanation of '{topic}' suitable for a student who needs this information as background knowledge. 
+def _build_explanation_prompt(topic):
+    return f"""Provide a clear, concise explanation of '{topic}' suitable for a student who needs this information as background knowledge. 
 
 Important: Use ONLY your general knowledge for this explanation. Do NOT refer to any document or PDF content.
 
@@ -66,10 +72,20 @@ The explanation should:
 Keep the explanation under 200 words, focusing on clarity and helpfulness. 
 Remember to ONLY use your general knowledge, not information from any document."""
 
+def stream_prerequisite_explanation(topic, llm):
+    """Explain a prerequisite topic from general knowledge, yielded chunk by chunk for st.write_stream"""
+    if not topic or not llm:
+        yield f"Couldn't find info: '{topic}'."
+        return
+    print(f"DEBUG: Streaming prerequisite explanation: {topic}")
+
+    yield f"*Prerequisite: {topic}*\n\n"
     try:
-        response = llm.invoke(prompt)
-        explanation = response.content
-        return f"*Prerequisite: {topic}*\n\n{explanation}\n\n---\n\nNow, about your original question:"
+        key = make_flight_key(None, topic, "prereq-explain")
+        yield from LLM_FLIGHTS.stream(key, lambda: stream_llm_text(llm, _build_explanation_prompt(topic)))
+        yield "\n\n---\n\nNow, about your original question:"
+    except SchedulerBusyError:
+        yield BUSY_MESSAGE
     except Exception as e: 
         print(f"Error explaining prerequisite: {e}")
-        return f"Error explaining '{topic}'."
\ No newline at end of file
+        yield f"Error explaining '{topic}'."
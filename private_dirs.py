@@ -0,0 +1,31 @@
+"""
+private_dirs.py - Scratch directories for index files that only this user can read
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+
+_lock = threading.Lock()
+_DIRS = {}  # (configured path, prefix) -> directory in use
+
+def private_dir(configured=None, prefix="chatbot-"):
+    """The configured directory (created or tightened to mode 0700), else a fresh mkdtemp removed at exit.
+
+    Files under it are loaded back into the server, so a predictable,
+    world-writable location such as /tmp/<fixed name> must never be used.
+    """
+    key = (configured, prefix)
+    with _lock:
+        path = _DIRS.get(key)
+        if path is None:
+            if configured:
+                os.makedirs(configured, mode=0o700, exist_ok=True)
+                os.chmod(configured, 0o700)
+                path = configured
+            else:
+                path = tempfile.mkdtemp(prefix=prefix)
+                atexit.register(shutil.rmtree, path, True)
+            _DIRS[key] = path
+        return path
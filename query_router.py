@@ -0,0 +1,140 @@
+"""
+query_router.py - Local intent router that sends each chat message down the cheapest adequate path
+"""
+import math
+import re
+import threading
+import metrics
+from session_manager import debug_log
+from page_index import parse_navigation_query
+
+INTENT_CHIT_CHAT = "chit-chat"
+INTENT_NAVIGATION = "navigation"
+INTENT_VERBATIM = "verbatim"
+INTENT_REFORMULATION = "reformulation"
+INTENT_DOCUMENT = "document"
+
+# Messages longer than this are never treated as chit-chat
+MAX_CHIT_CHAT_WORDS = 6
+# Longer messages are real questions even if they say "shorter" or "simpler"
+MAX_REFORMULATION_WORDS = 12
+# Cosine similarity to a prototype needed to accept an embedding match
+PROTOTYPE_THRESHOLD = 0.8
+
+CHIT_CHAT_REPLIES = {
+    "thanks": "You're welcome! Feel free to ask anything else about the document.",
+    "greeting": "Hello! Ask me anything about your document.",
+    "bye": "Goodbye! Good luck with your studies.",
+    "ack": "Great! Let me know if you have another question about the document.",
+}
+
+CHIT_CHAT_RULES = [
+    ("thanks", r"^(thanks?( you)?|thx|ty|merci|much appreciated|cheers)\b"),
+    ("greeting", r"^(hi|hello|hey|good (morning|afternoon|evening)|bonjour|salut)\b"),
+    ("bye", r"^(bye|goodbye|good bye|see you|au revoir)\b"),
+    ("ack", r"^(ok|okay|k|cool|great|nice|perfect|awesome|got it|i see|understood|alright|sure)\b"),
+]
+
+# Words that may follow a chit-chat opener without making it a real request
+CHIT_CHAT_FILLER = {
+    "you", "so", "much", "a", "lot", "that", "this", "helps", "helped", "very", "for", "the", "help",
+    "there", "again", "thanks", "thank", "great", "ok", "okay", "cool", "got", "it", "now", "perfect",
+    "awesome", "nice", "good", "makes", "sense", "bot", "everyone", "all",
+}
+
+VERBATIM_PATTERN = r"\b(exact text|verbatim|raw text|word for word|exact (wording|quote)|quote the)\b"
+
+REFORMULATION_PATTERN = (
+    r"\b(shorter|simpler|in simpler terms|simplify|rephrase|reword|repeat (that|it)|say (that|it) again"
+    r"|explain (that|it) again|summari[sz]e (that|it|your answer)|tl;?dr|in bullet points|as bullet points"
+    r"|as a list|more concise|eli5|like i'?m five|translate (that|it))\b"
+)
+
+PROTOTYPES = {
+    INTENT_CHIT_CHAT: [
+        "thank you so much", "thanks that helps", "hello there", "that's great", "ok got it",
+    ],
+    INTENT_REFORMULATION: [
+        "can you repeat that shorter", "explain your last answer more simply",
+        "make the previous answer shorter", "rewrite that as bullet points",
+    ],
+}
+
+_prototype_cache = {}
+_prototype_lock = threading.Lock()
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _prototype_vectors(embedding_model):
+    """Embed the intent prototypes once per embedding model"""
+    key = id(embedding_model)
+    with _prototype_lock:
+        if key not in _prototype_cache:
+            _prototype_cache[key] = {
+                intent: embedding_model.embed_documents(phrases) for intent, phrases in PROTOTYPES.items()
+            }
+        return _prototype_cache[key]
+
+def _closest_prototype(text, embedding_model):
+    vector = embedding_model.embed_query(text)
+    best_intent, best_score = None, 0.0
+    for intent, vectors in _prototype_vectors(embedding_model).items():
+        score = max(_cosine(vector, prototype) for prototype in vectors)
+        if score > best_score:
+            best_intent, best_score = intent, score
+    return best_intent, best_score
+
+def classify_message(text, has_previous_answer=False, embedding_model=None):
+    """Return (intent, detail). Rules first; the embedding model only settles short ambiguous messages."""
+    lowered = text.strip().lower()
+    words = lowered.split()
+
+    if parse_navigation_query(lowered):
+        return INTENT_NAVIGATION, None
+
+    if len(words) <= MAX_CHIT_CHAT_WORDS and "?" not in lowered:
+        for kind, pattern in CHIT_CHAT_RULES:
+            match = re.match(pattern, lowered)
+            if match and set(re.findall(r"[a-z']+", lowered[match.end():])) <= CHIT_CHAT_FILLER:
+                return INTENT_CHIT_CHAT, kind
+
+    if re.search(VERBATIM_PATTERN, lowered):
+        return INTENT_VERBATIM, None
+
+    if (has_previous_answer and len(words) <= MAX_REFORMULATION_WORDS
+            and re.search(REFORMULATION_PATTERN, lowered)):
+        return INTENT_REFORMULATION, None
+
+    if embedding_model is not None and len(words) <= 10:
+        try:
+            intent, score = _closest_prototype(lowered, embedding_model)
+            if score >= PROTOTYPE_THRESHOLD:
+                if intent == INTENT_CHIT_CHAT and "?" not in lowered:
+                    return INTENT_CHIT_CHAT, "ack"
+                if intent == INTENT_REFORMULATION and has_previous_answer:
+                    return INTENT_REFORMULATION, None
+        except Exception as e:
+            debug_log(f"Router embedding check failed: {e}")
+
+    return INTENT_DOCUMENT, None
+
+def route_message(text, has_previous_answer=False, embedding_model=None):
+    """classify_message plus logging/metrics"""
+    intent, detail = classify_message(text, has_previous_answer, embedding_model)
+    metrics.increment("router.messages", intent=intent)
+    debug_log(f"Router: '{text[:40]}' -> {intent}")
+    return intent, detail
+
+REFORMULATION_PROMPT = """Here is an answer you previously gave a student:
+
+{previous_answer}
+
+The student now asks: "{request}"
+
+Rewrite the previous answer accordingly. Do not add new facts that are not in the previous answer."""
+
+def build_reformulation_prompt(previous_answer, request):
+    return REFORMULATION_PROMPT.format(previous_answer=previous_answer, request=request)
@@ -1,11 +1,13 @@
-from langchain.chains import RetrievalQA
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from langchain.prompts import PromptTemplate
+from ai_models import stream_llm_text
+from singleflight import LLM_FLIGHTS, make_flight_key
+from context_packing import pack_documents, MAX_CONTEXT_TOKENS
+from adaptive_retrieval import adaptive_search, adaptive_search_by_vector
+from section_summaries import stream_summary_answer
 
-def create_rag_chain(_db, _llm):
-    if _db is None: return None
-    print("Creating RAG chain...")
-    retriever = _db.as_retriever(search_kwargs={'k': 5})
-    prompt_template = """You are a helpful educational assistant. Your task is to answer questions about educational content based STRICTLY on the provided text snippets from the document.
+RAG_PROMPT_TEMPLATE = """You are a helpful educational assistant. Your task is to answer questions about educational content based STRICTLY on the provided text snippets from the document.
 
 Context information from the document is below:
 {context}
@@ -23,7 +25,107 @@ Important guidelines:
 
 Remember: You must ONLY use information from the provided context."""
 
-    QA_CHAIN_PROMPT = PromptTemplate.from_template(prompt_template)
-    qa_chain = RetrievalQA.from_chain_type(_llm, retriever=retriever, chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}, return_source_documents=True)
+# Parallel vector store searches for one batch of questions
+BATCH_RETRIEVAL_WORKERS = 8
+
+QA_CHAIN_PROMPT = PromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
+
+class RagChain:
+    """Retrieve -> stuff prompt -> streamed LLM answer"""
+
+    def __init__(self, db, llm, k=5, fingerprint=None, token_budget=MAX_CONTEXT_TOKENS, adaptive=True):
+        self.llm = llm
+        self.k = k
+        self.token_budget = token_budget
+        # Adaptive mode picks k per query from the score distribution; otherwise fixed k
+        self.adaptive = adaptive
+        self.use_store(db)
+        # Identifies the document for request coalescing across sessions
+        self.fingerprint = fingerprint or f"db-{id(db)}"
+
+    def use_store(self, db):
+        """Point the chain at a (re)loaded vector store, or at None while it is evicted"""
+        self.db = db
+        self.retriever = db.as_retriever(search_kwargs={'k': self.k}) if db is not None else None
+
+    def retrieve(self, query, working_set=None, deadline=None):
+        """Return the source documents for a query, with overlapping chunks merged.
+
+        With a conversation working set, a follow-up close to recently retrieved
+        chunks reuses them and only fetches a couple of fresh chunks.
+        """
+        embedding_model = getattr(self.db, "embeddings", None)
+        chunks = query_vector = None
+        if working_set is not None and len(working_set) and embedding_model is not None:
+            query_vector = embedding_model.embed_query(query)
+            chunks = working_set.follow_up(self.db, query_vector)
+        if chunks is None:
+            chunks = self._coalesced_search(query, query_vector, deadline)
+        if working_set is not None and embedding_model is not None:
+            working_set.add(chunks, self.db)
+        return pack_documents(chunks, self.token_budget)
+
+    def retrieve_many(self, queries):
+        """Retrieve for several queries at once: one embedding batch, then the searches in parallel"""
+        queries = list(queries)
+        if not queries:
+            return []
+        embedding_model = getattr(self.db, "embeddings", None)
+        if embedding_model is not None:
+            vectors = embedding_model.embed_documents(queries)
+        else:
+            vectors = [None] * len(queries)
+        workers = min(BATCH_RETRIEVAL_WORKERS, len(queries))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-retrieve") as pool:
+            chunk_lists = list(pool.map(self._coalesced_search, queries, vectors))
+        return [pack_documents(chunks, self.token_budget) for chunks in chunk_lists]
+
+    def _coalesced_search(self, query, query_vector=None, deadline=None):
+        key = make_flight_key(self.fingerprint, query, "retrieve")
+        return LLM_FLIGHTS.do(key, lambda: self._search(query, query_vector), deadline)
+
+    def _search(self, query, query_vector=None):
+        if self.adaptive:
+            try:
+                if query_vector is not None:
+                    return adaptive_search_by_vector(self.db, query_vector, token_budget=self.token_budget)
+                return adaptive_search(self.db, query, token_budget=self.token_budget)
+            except NotImplementedError:
+                # Store without relevance scores: fall back to fixed k
+                self.adaptive = False
+        if query_vector is not None:
+            return self.db.similarity_search_by_vector(query_vector, k=self.k)
+        return self.retriever.invoke(query)
+
+    def build_prompt(self, query, source_docs):
+        """Stuff the retrieved snippets into the QA prompt"""
+        context = "\n\n".join(doc.page_content for doc in source_docs)
+        return QA_CHAIN_PROMPT.format(context=context, question=query)
+
+    def _answer_key(self, query, prompt):
+        # The context depends on each conversation's working set, so only identical prompts share an answer
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        return make_flight_key(f"{self.fingerprint}-{digest}", query, "answer")
+
+    def answer_from_docs(self, query, source_docs):
+        """Whole answer for already retrieved documents (the stream, collected)"""
+        return "".join(self.stream_from_docs(query, source_docs))
+
+    def stream_from_docs(self, query, source_docs, deadline=None):
+        """Yield answer text chunks for already retrieved documents"""
+        prompt = self.build_prompt(query, source_docs)
+        return LLM_FLIGHTS.stream(self._answer_key(query, prompt), lambda: stream_llm_text(self.llm, prompt), deadline)
+
+    def stream_summary(self, query, tree, deadline=None):
+        """Stream an answer from the document's section summary tree, or None if it isn't built yet"""
+        if tree is None:
+            return None
+        key = make_flight_key(self.fingerprint, query, "summary-answer")
+        return LLM_FLIGHTS.stream(key, lambda: stream_summary_answer(query, tree, self.llm), deadline)
+
+def create_rag_chain(_db, _llm, fingerprint=None):
+    if _db is None: return None
+    print("Creating RAG chain...")
+    qa_chain = RagChain(_db, _llm, k=5, fingerprint=fingerprint)
     print("RAG chain created.")
-    return qa_chain
\ No newline at end of file
+    return qa_chain
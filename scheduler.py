@@ -0,0 +1,169 @@
+"""
+scheduler.py - Fair-share admission control and priority scheduling for LLM work
+"""
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import metrics
+from llm_client import MAX_CONCURRENT_LLM_CALLS
+from session_manager import debug_log
+
+# Priority classes (lower value = served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREREQ = 1
+PRIORITY_BACKGROUND = 2
+
+TASK_PRIORITIES = {
+    "answer": PRIORITY_INTERACTIVE,
+    "prereq-explain": PRIORITY_INTERACTIVE,  # the user explicitly asked for it
+    "reformulate": PRIORITY_INTERACTIVE,
+    "prereq-detect": PRIORITY_PREREQ,
+    "notes": PRIORITY_BACKGROUND,
+    "summary": PRIORITY_BACKGROUND,
+}
+
+# Lower priorities are shed first: fraction of the queue they may fill
+SHED_FRACTIONS = {
+    PRIORITY_INTERACTIVE: 1.0,
+    PRIORITY_PREREQ: 0.75,
+    PRIORITY_BACKGROUND: 0.5,
+}
+
+MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "32"))
+MAX_QUEUE_WAIT_SECONDS = float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "30"))
+
+BUSY_MESSAGE = "⏳ The assistant is very busy right now. Please try again in a moment."
+
+class SchedulerBusyError(Exception):
+    """Raised when a request is shed instead of queued"""
+
+class _Ticket:
+    def __init__(self, user, priority):
+        self.user = user
+        self.priority = priority
+        self.granted = False
+
+class LLMScheduler:
+    """Grants LLM slots by priority class, round-robin across users within a class.
+
+    Work still runs in the caller's thread; the scheduler only decides who
+    goes next. When the queue is too deep for a request's priority class it
+    is rejected with SchedulerBusyError rather than left waiting.
+    """
+
+    def __init__(self, max_active=MAX_CONCURRENT_LLM_CALLS, max_queue_depth=MAX_QUEUE_DEPTH,
+                 max_wait=MAX_QUEUE_WAIT_SECONDS):
+        self.max_active = max_active
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._active = 0
+        self._depth = 0
+        # priority -> OrderedDict(user -> deque of tickets); user order is the round-robin order
+        self._queues = {priority: OrderedDict() for priority in SHED_FRACTIONS}
+
+    def _update_gauges(self):
+        metrics.set_gauge("scheduler.active", self._active)
+        metrics.set_gauge("scheduler.queue_depth", self._depth)
+
+    def _enqueue(self, ticket):
+        users = self._queues[ticket.priority]
+        users.setdefault(ticket.user, deque()).append(ticket)
+        self._depth += 1
+
+    def _remove(self, ticket):
+        users = self._queues[ticket.priority]
+        tickets = users.get(ticket.user)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            self._depth -= 1
+            if not tickets:
+                del users[ticket.user]
+
+    def _grant_next(self):
+        while self._active < self.max_active and self._depth > 0:
+            for priority in sorted(self._queues):
+                users = self._queues[priority]
+                if not users:
+                    continue
+                user, tickets = next(iter(users.items()))
+                ticket = tickets.popleft()
+                # Rotate this user to the back so others get the next turn
+                del users[user]
+                if tickets:
+                    users[user] = tickets
+                break
+            self._depth -= 1
+            self._active += 1
+            ticket.granted = True
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, user, priority, max_wait=None):
+        """Hold one LLM slot for the duration of the with-block"""
+        ticket = _Ticket(user or "anonymous", priority)
+        max_wait = self.max_wait if max_wait is None else min(max_wait, self.max_wait)
+        started = time.monotonic()
+        with self._cond:
+            if self._active < self.max_active and self._depth == 0:
+                self._active += 1
+                ticket.granted = True
+            else:
+                if self._depth >= self.max_queue_depth * SHED_FRACTIONS[priority]:
+                    metrics.increment("scheduler.shed", priority=priority)
+                    debug_log(f"Scheduler: shedding priority {priority} request from {ticket.user}")
+                    raise SchedulerBusyError(BUSY_MESSAGE)
+                self._enqueue(ticket)
+                self._update_gauges()
+                deadline = started + max_wait
+                while not ticket.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(ticket)
+                        self._update_gauges()
+                        metrics.increment("scheduler.shed", priority=priority)
+                        raise SchedulerBusyError(BUSY_MESSAGE)
+                    self._cond.wait(timeout=remaining)
+            self._update_gauges()
+        metrics.observe("scheduler.wait", time.monotonic() - started, priority=priority)
+
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._grant_next()
+                self._update_gauges()
+
+# Shared by every session in this process
+LLM_SCHEDULER = LLMScheduler()
+
+class ScheduledLLM:
+    """LLM handle bound to a user and task; every call goes through the scheduler"""
+
+    def __init__(self, llm, user, task, scheduler=None):
+        self.llm = llm
+        self.user = user
+        self.task = task
+        self.priority = TASK_PRIORITIES.get(task, PRIORITY_INTERACTIVE)
+        self.scheduler = scheduler or LLM_SCHEDULER
+
+    def __getattr__(self, attr):
+        return getattr(self.llm, attr)
+
+    def invoke(self, prompt, **kwargs):
+        # A caller deadline (timeout=...) also bounds the wait for a slot
+        with self.scheduler.slot(self.user, self.priority, kwargs.get("timeout")):
+            return self.llm.invoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        with self.scheduler.slot(self.user, self.priority, kwargs.get("timeout")):
+            yield from self.llm.stream(prompt, **kwargs)
+
+def scheduled_llm(llm, user, task):
+    """Bind the shared LLM to a user and task type, or None when there is no LLM"""
+    if llm is None:
+        return None
+    return ScheduledLLM(llm, user, task)
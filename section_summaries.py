@@ -0,0 +1,184 @@
+"""
+section_summaries.py - Section/page-level summary tree built once per document for broad questions
+"""
+import json
+import os
+import re
+import threading
+import metrics
+from session_manager import debug_log
+from ai_models import stream_llm_text
+from mapped_index import INDEX_STORE_DIR
+
+# Page clusters used when the PDF has no bookmarks
+PAGES_PER_SECTION = 5
+# Text sent per section summary call
+MAX_SECTION_CHARS = 12000
+
+BROAD_QUESTION_PATTERNS = [
+    r"\bsummar(y|ize|ise|ies)\b",
+    r"\boverview\b",
+    r"\bmain (points|ideas|topics|themes)\b",
+    r"\bkey (points|takeaways|ideas)\b",
+    r"\bwhat (is|are) (this|the) (document|pdf|chapter|course|book)s? about\b",
+    r"\bgist\b",
+]
+
+# Words that say nothing about which section a question is about
+QUESTION_STOPWORDS = {
+    "what", "this", "that", "about", "give", "please", "with", "from", "these", "those",
+    "summary", "summarize", "summarise", "overview", "main", "points", "ideas", "topics",
+    "themes", "takeaways", "chapter", "section", "document", "course", "book", "gist",
+}
+
+# Summary trees are stored next to the document indexes, one JSON file per document
+SUMMARIES_DIR = os.path.join(INDEX_STORE_DIR, "summaries")
+
+_lock = threading.Lock()
+_BUILDING = set()  # fingerprints whose tree is being built in this process
+
+SECTION_PROMPT = """Summarize the following section of a course document for a student.
+Keep the key concepts, definitions and results. Use at most 150 words and do not add outside knowledge.
+
+Section: {title}
+
+{text}"""
+
+DOCUMENT_PROMPT = """Below are summaries of each section of a course document.
+Write an overview of the whole document in at most 200 words, covering the main topics in order.
+
+{summaries}"""
+
+ANSWER_PROMPT = """You are a helpful educational assistant. Answer the student's question using ONLY the section summaries of the document below.
+If the summaries don't contain the information needed, say so.
+
+{summaries}
+
+Question: {question}"""
+
+def is_broad_question(query):
+    """True for summary/overview style questions that retrieval of a few chunks can't answer"""
+    text = query.lower()
+    return any(re.search(pattern, text) for pattern in BROAD_QUESTION_PATTERNS)
+
+def build_sections(page_documents, outline=None):
+    """Split the document into sections from its outline, or into fixed page clusters"""
+    page_texts = {}
+    for doc in page_documents:
+        page = doc.metadata.get("page", 0)
+        page_texts[page] = page_texts.get(page, "") + doc.page_content
+    if not page_texts:
+        return []
+    last_page = max(page_texts)
+
+    entries = outline or []
+    top_level = [entry for entry in entries if entry["level"] == 0]
+    if len(top_level) >= 2:
+        entries = top_level
+    entries = sorted(entries, key=lambda entry: entry["page"])
+
+    sections = []
+    if entries:
+        for i, entry in enumerate(entries):
+            end_page = entries[i + 1]["page"] - 1 if i + 1 < len(entries) else last_page
+            sections.append({"title": entry["title"], "start_page": entry["page"], "end_page": max(entry["page"], end_page)})
+    else:
+        for start in range(0, last_page + 1, PAGES_PER_SECTION):
+            end = min(start + PAGES_PER_SECTION - 1, last_page)
+            sections.append({"title": f"Pages {start + 1}-{end + 1}", "start_page": start, "end_page": end})
+
+    for section in sections:
+        text = "\n".join(page_texts.get(p, "") for p in range(section["start_page"], section["end_page"] + 1))
+        section["text"] = text[:MAX_SECTION_CHARS]
+    return [section for section in sections if section["text"].strip()]
+
+def build_summary_tree(page_documents, llm, outline=None):
+    """Summarize every section, then summarize the summaries"""
+    sections = build_sections(page_documents, outline)
+    for section in sections:
+        response = llm.invoke(SECTION_PROMPT.format(title=section["title"], text=section.pop("text")))
+        section["summary"] = response.content.strip()
+    summaries = "\n\n".join(f"{s['title']}: {s['summary']}" for s in sections)
+    document_summary = llm.invoke(DOCUMENT_PROMPT.format(summaries=summaries)).content.strip() if sections else ""
+    return {"document": document_summary, "sections": sections}
+
+def summary_path(fingerprint):
+    return os.path.join(SUMMARIES_DIR, f"{fingerprint[:32]}.json")
+
+def save_summary_tree(fingerprint, tree):
+    """Write the tree atomically, so it survives restarts and is shared with other processes"""
+    os.makedirs(SUMMARIES_DIR, exist_ok=True)
+    path = summary_path(fingerprint)
+    with open(f"{path}.tmp-{os.getpid()}", "w", encoding="utf-8") as tree_file:
+        json.dump(tree, tree_file)
+    os.replace(f"{path}.tmp-{os.getpid()}", path)
+
+def load_summary_tree(fingerprint):
+    """The stored summary tree of a document, or None if it has not been built"""
+    if not fingerprint:
+        return None
+    try:
+        with open(summary_path(fingerprint), encoding="utf-8") as tree_file:
+            return json.load(tree_file)
+    except (OSError, ValueError):
+        return None
+
+def start_summary_build(fingerprint, page_documents, llm, outline=None):
+    """Build and store the summary tree for a document in a background thread (once per fingerprint)"""
+    if not fingerprint or llm is None or os.path.exists(summary_path(fingerprint)):
+        return
+    with _lock:
+        if fingerprint in _BUILDING:
+            return
+        _BUILDING.add(fingerprint)
+
+    def worker():
+        try:
+            tree = build_summary_tree(page_documents, llm, outline)
+            save_summary_tree(fingerprint, tree)
+            metrics.increment("summaries.built")
+            debug_log(f"Summary tree ready: {len(tree['sections'])} sections")
+        except Exception as e:
+            # A later upload of the same document retries
+            debug_log(f"Summary tree build failed: {e}")
+        finally:
+            with _lock:
+                _BUILDING.discard(fingerprint)
+
+    threading.Thread(target=worker, name="summary-builder", daemon=True).start()
+
+def select_summaries(query, tree):
+    """Pick the summary level for a question: one chapter/section if named, else the whole document"""
+    text = query.lower()
+    sections = tree["sections"]
+
+    match = re.search(r"\b(?:chapter|part|unit|section)\s+(\d+)\b", text)
+    if match:
+        number = match.group(1)
+        named = [s for s in sections if re.search(rf"(?<![\d.]){number}(?![\d.])", s["title"].lower())]
+        if not named and 0 < int(number) <= len(sections):
+            named = [sections[int(number) - 1]]
+        if named:
+            return named
+
+    words = {w for w in re.findall(r"[a-z]{4,}", text)} - QUESTION_STOPWORDS
+    titled = [s for s in sections if words & set(re.findall(r"[a-z]{4,}", s["title"].lower()))]
+    if titled:
+        return titled
+    return [{"title": "Whole document", "summary": tree["document"], "start_page": None}] + sections
+
+def _format_summaries(selected):
+    parts = []
+    for section in selected:
+        pages = ""
+        if section.get("start_page") is not None:
+            pages = f" (pages {section['start_page'] + 1}-{section['end_page'] + 1})"
+        parts.append(f"## {section['title']}{pages}\n{section['summary']}")
+    return "\n\n".join(parts)
+
+def stream_summary_answer(query, tree, llm):
+    """Answer a broad question with one LLM call over the summary level"""
+    selected = select_summaries(query, tree)
+    metrics.increment("summaries.answers")
+    debug_log(f"Answering from {len(selected)} section summaries")
+    return stream_llm_text(llm, ANSWER_PROMPT.format(summaries=_format_summaries(selected), question=query))
@@ -22,20 +22,33 @@ def initialize_session_state():
         st.session_state.current_conversation_id = None
     if "loaded_convo_id" not in st.session_state:
         st.session_state.loaded_convo_id = None
+    if "history_pages" not in st.session_state:
+        st.session_state.history_pages = 1
+    if "pending_answers" not in st.session_state:
+        st.session_state.pending_answers = {}
+    if "working_set" not in st.session_state:
+        from working_set import WorkingSet
+        st.session_state.working_set = WorkingSet()
     
     # RAG and AI states
-    if "vector_store" not in st.session_state: 
-        st.session_state.vector_store = None 
+    if "collection_handle" not in st.session_state:
+        st.session_state.collection_handle = None
     if "rag_chain" not in st.session_state: 
         st.session_state.rag_chain = None 
     if "llm" not in st.session_state:
         st.session_state.llm = None
+    if "task_llms" not in st.session_state:
+        st.session_state.task_llms = None
     if "embedding_model" not in st.session_state:
         st.session_state.embedding_model = None
     
     # File processing states
     if "processed_file_name" not in st.session_state: 
         st.session_state.processed_file_name = None 
+    if "document_fingerprint" not in st.session_state:
+        st.session_state.document_fingerprint = None
+    if "page_index" not in st.session_state:
+        st.session_state.page_index = None
     
     # Prerequisite handling states
     if "current_question" not in st.session_state: 
@@ -72,6 +85,8 @@ def reset_conversation_state():
     st.session_state.messages = [{"role": "assistant", "content": "Hello! How can I help you today?"}]
     st.session_state.current_conversation_id = None 
     st.session_state.loaded_convo_id = None
+    from working_set import WorkingSet
+    st.session_state.working_set = WorkingSet()
     st.session_state.prereq_history = set()
     st.session_state.check_prereqs = True
     st.session_state.prereq_checkbox_state = True
@@ -79,7 +94,12 @@ def reset_conversation_state():
 
 def reset_file_processing_state():
     """Reset file processing related states"""
-    st.session_state.vector_store = None
+    from vector_collections import release_session_collection
+    release_session_collection()
     st.session_state.rag_chain = None
     st.session_state.processed_file_name = None
+    st.session_state.document_fingerprint = None
+    st.session_state.page_index = None
+    from working_set import WorkingSet
+    st.session_state.working_set = WorkingSet()
     debug_log("Reset file processing state")
\ No newline at end of file
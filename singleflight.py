@@ -0,0 +1,120 @@
+"""
+singleflight.py - Coalesce identical in-flight LLM and retrieval requests across sessions
+"""
+import re
+import threading
+import metrics
+from session_manager import debug_log
+from deadlines import DeadlineExceeded
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+
+def normalize_prompt(text):
+    """Lowercase and collapse whitespace so trivially different prompts share a key"""
+    return re.sub(r"\s+", " ", (text or "").strip().lower())
+
+def make_flight_key(fingerprint, prompt, task):
+    """Key for (document fingerprint, normalized prompt, task type)"""
+    return (fingerprint or "", normalize_prompt(prompt), task)
+
+class SingleFlight:
+    """The first caller for a key runs the work; concurrent callers wait and share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        """Return (call, is_leader)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def _wait(self, call, task, deadline):
+        """Wait for the leader, at most until the caller's deadline; True if it finished"""
+        if call.done.wait(timeout=deadline.remaining() if deadline is not None else None):
+            return True
+        metrics.increment("singleflight.timeout", task=task)
+        return False
+
+    def _finish(self, key, call):
+        with self._lock:
+            self._calls.pop(key, None)
+        call.done.set()
+
+    def do(self, key, fn, deadline=None):
+        """Run fn() once for all concurrent callers with the same key.
+
+        A caller that joins an in-flight call waits no longer than its deadline
+        and then raises DeadlineExceeded.
+        """
+        call, is_leader = self._join(key)
+        task = key[-1]
+        if not is_leader:
+            debug_log(f"Single-flight: sharing in-flight {task} request")
+            if not self._wait(call, task, deadline):
+                raise DeadlineExceeded(f"in-flight {task} request missed the deadline")
+            metrics.increment("singleflight.shared", task=task)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.increment("singleflight.leader", task=task)
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def stream(self, key, fn, deadline=None):
+        """Streaming variant: fn() returns an iterator of text chunks.
+
+        The leader yields chunks as they arrive; followers get the complete
+        text as one chunk once the leader is done. If the leader's consumer
+        stops early, or the leader is still going when a follower's deadline
+        passes, that follower runs its own stream instead.
+        """
+        call, is_leader = self._join(key)
+        task = key[-1]
+        if not is_leader:
+            debug_log(f"Single-flight: waiting on in-flight {task} stream")
+            if not self._wait(call, task, deadline) or call.abandoned:
+                yield from fn()
+                return
+            metrics.increment("singleflight.shared", task=task)
+            if call.error is not None:
+                raise call.error
+            yield call.result
+            return
+
+        metrics.increment("singleflight.leader", task=task)
+        parts = []
+        finished = False
+        try:
+            for part in fn():
+                parts.append(part)
+                yield part
+            call.result = "".join(parts)
+            finished = True
+        except Exception as e:
+            call.error = e
+            finished = True
+            raise
+        finally:
+            call.abandoned = not finished
+            self._finish(key, call)
+
+# Shared by every session in this process
+LLM_FLIGHTS = SingleFlight()
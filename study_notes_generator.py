@@ -11,6 +11,8 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.colors import HexColor
 import markdown2
+from ai_models import stream_llm_text, get_task_llm
+from scheduler import SchedulerBusyError, BUSY_MESSAGE, scheduled_llm
 
 def extract_study_content(messages):
     """Extract educational content from conversation messages"""
@@ -34,18 +36,15 @@ def extract_study_content(messages):
     
     return study_content
 
-def generate_study_notes(study_content, llm, document_name=None):
-    """Generate structured study notes using the LLM"""
-    if not study_content or not llm:
-        return "No study content available to generate notes."
-    
+def _build_study_notes_prompt(study_content):
+    """Build the notes prompt from the extracted Q&A pairs"""
     # Prepare the content for analysis
     content_text = ""
     for item in study_content:
         content_text += f"Q: {item['question']}\nA: {item['answer']}\n\n"
     
     # Create prompt for study notes generation
-    prompt = f"""Based on the following educational conversation, create comprehensive study notes in a clear, organized format.
+    return f"""Based on the following educational conversation, create comprehensive study notes in a clear, organized format.
 
 CONVERSATION CONTENT:
 {content_text}
@@ -76,24 +75,30 @@ Keep the language clear and educational. Focus on the most important information
 
 If there are any prerequisite concepts mentioned, include them in a separate "Prerequisites" section."""
 
-    try:
-        # Generate notes using the LLM
-        response = llm.invoke(prompt)
-        notes = response.content
-        
-        # Add header with metadata
-        header = f"""# Study Notes
+def _build_study_notes_header(study_content, document_name=None):
+    """Header with metadata prepended to the generated notes"""
+    header = f"""# Study Notes
 **Generated on:** {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
 """
-        if document_name:
-            header += f"**Source Document:** {document_name}\n"
-        
-        header += f"**Total Q&A Pairs Analyzed:** {len(study_content)}\n\n---\n\n"
-        
-        return header + notes
-        
+    if document_name:
+        header += f"**Source Document:** {document_name}\n"
+    
+    header += f"**Total Q&A Pairs Analyzed:** {len(study_content)}\n\n---\n\n"
+    return header
+
+def stream_study_notes(study_content, llm, document_name=None):
+    """Generate structured study notes with the LLM, yielded chunk by chunk for st.write_stream"""
+    if not study_content or not llm:
+        yield "No study content available to generate notes."
+        return
+    
+    yield _build_study_notes_header(study_content, document_name)
+    try:
+        yield from stream_llm_text(llm, _build_study_notes_prompt(study_content))
+    except SchedulerBusyError:
+        yield BUSY_MESSAGE
     except Exception as e:
-        return f"Error generating study notes: {str(e)}"
+        yield f"Error generating study notes: {str(e)}"
 
 def create_downloadable_notes(notes_content, filename_prefix="study_notes"):
     """Create a downloadable PDF file for the study notes"""
@@ -317,16 +322,16 @@ def display_study_notes_generator():
                 st.error("LLM not available for generating notes.")
                 return
             
-            with st.spinner("🧠 Creating your study notes..."):
-                # Generate the notes
-                notes = generate_study_notes(
+            # Stream the notes while they are generated
+            with st.container(height=300):
+                notes = st.write_stream(stream_study_notes(
                     study_content, 
-                    st.session_state.llm,
+                    scheduled_llm(get_task_llm("notes"), st.session_state.username, "notes"),
                     st.session_state.get('processed_file_name')
-                )
-                
-                # Store in session state for display
-                st.session_state.generated_notes = notes
+                ))
+            
+            # Store in session state for display
+            st.session_state.generated_notes = notes
                 
             st.success("✅ Study notes ready!")
             st.rerun()
@@ -6,6 +6,8 @@ import hashlib
 import streamlit as st
 from datetime import datetime, timedelta
 from database_manager import authenticate_user, create_user
+from vector_collections import release_session_collection
+from write_behind import flush_saves
 
 def create_auth_key(username):
     """Create a simple auth key for the user"""
@@ -150,8 +152,8 @@ def check_auth_state():
                     
                     # Load the conversation from database
                     try:
-                        from database_manager import load_conversation
-                        conversation = load_conversation(restore_user, restore_convo)
+                        from conversation_history import open_conversation
+                        conversation = open_conversation(restore_user, restore_convo)
                         if conversation:
                             st.session_state.messages = conversation['messages']
                     except Exception as e:
@@ -184,11 +186,17 @@ def check_auth_state():
 
 def clear_auth_state():
     """Clear authentication state completely"""
+    # Write the user's queued conversation saves before their session state goes away
+    flush_saves()
+    
+    # Delete the session's vector collection now rather than when it is garbage collected
+    release_session_collection()
+    
     # Clear session state
     keys_to_clear = [
         'user_authenticated', 'username', 'auth_key',
-        'messages', 'current_conversation_id', 'loaded_convo_id',
-        'vector_store', 'rag_chain', 'processed_file_name',
+        'messages', 'current_conversation_id', 'loaded_convo_id', 'history_pages', 'working_set', 'pending_answers',
+        'collection_handle', 'rag_chain', 'processed_file_name', 'document_fingerprint', 'page_index',
         'current_question', 'prerequisite_topic', 'waiting_for_prereq_response',
         'prereq_history', 'check_prereqs', 'prereq_checkbox_state',
         'generated_notes', 'show_notes_modal'
@@ -0,0 +1,371 @@
+"""
+vector_collections.py - Named vector collections (mapped files, NumPy or Chroma) with explicit deletion, memory accounting and spill to disk
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import weakref
+import numpy as np
+import streamlit as st
+import metrics
+from session_manager import debug_log
+from private_dirs import private_dir
+
+# Rough per-vector overhead of the HNSW graph (links and ids), in bytes
+HNSW_OVERHEAD_BYTES = 200
+# "auto" picks by chunk count; "mapped", "numpy", "hnsw" or "chroma" forces a backend
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+# Documents up to this many chunks use brute-force search over shared mapped files, larger
+# corpora an HNSW graph (Chroma when hnswlib is not installed)
+NUMPY_MAX_CHUNKS = int(os.getenv("NUMPY_MAX_CHUNKS", "20000"))
+# Where evicted collections are written until their session needs them again (default: a private
+# temporary directory per process)
+SPILL_DIR = os.getenv("INDEX_SPILL_DIR")
+# Rows per add() call when restoring a spilled collection
+RESTORE_BATCH_SIZE = 1000
+
+_client = None
+_client_lock = threading.Lock()
+_registry_lock = threading.Lock()
+_LIVE_COLLECTIONS = {}  # name -> {"backend": name, "chunks": n, "bytes": estimate, "evicted": bool}
+
+def _get_client():
+    """One in-memory Chroma client shared by every session of this process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            import chromadb
+            _client = chromadb.EphemeralClient()
+        return _client
+
+def collection_name(session_key, fingerprint):
+    """Deterministic collection name for one session's copy of one document"""
+    # Chroma names: 3-63 chars of [a-zA-Z0-9._-]
+    return f"s{session_key[:12]}-d{(fingerprint or 'unknown')[:16]}"
+
+class ChromaBackend:
+    """Collections in the shared in-memory Chroma client (HNSW index)"""
+    name = "chroma"
+
+    def build(self, texts, embedding_model, collection, fingerprint=None):
+        from langchain_community.vectorstores import Chroma
+        return Chroma.from_documents(texts, embedding_model, collection_name=collection, client=_get_client())
+
+    def estimate_bytes(self, store, texts, collection):
+        sample = _get_client().get_collection(collection).peek(1)["embeddings"]
+        dimensions = len(sample[0]) if sample is not None and len(sample) else 0
+        text_bytes = sum(len(doc.page_content.encode("utf-8")) for doc in texts)
+        return len(texts) * (dimensions * 4 + HNSW_OVERHEAD_BYTES) + text_bytes
+
+    def export(self, store, collection):
+        data = _get_client().get_collection(collection).get(include=["embeddings", "documents", "metadatas"])
+        return {
+            "ids": data["ids"],
+            "embeddings": [list(map(float, vector)) for vector in data["embeddings"]],
+            "documents": data["documents"],
+            "metadatas": data["metadatas"],
+        }
+
+    def restore(self, data, embedding_model, collection):
+        from langchain_community.vectorstores import Chroma
+        store = Chroma(collection_name=collection, embedding_function=embedding_model, client=_get_client())
+        chroma_collection = _get_client().get_collection(collection)
+        for start in range(0, len(data["ids"]), RESTORE_BATCH_SIZE):
+            end = start + RESTORE_BATCH_SIZE
+            chroma_collection.add(
+                ids=data["ids"][start:end],
+                embeddings=[list(map(float, vector)) for vector in data["embeddings"][start:end]],
+                documents=data["documents"][start:end],
+                metadatas=data["metadatas"][start:end],
+            )
+        return store
+
+    def delete(self, collection):
+        try:
+            _get_client().delete_collection(collection)
+        except Exception:
+            # Already gone (e.g. never fully created, or evicted)
+            pass
+
+class NumpyBackend:
+    """Exact search over a float32 matrix held by the store object itself"""
+    name = "numpy"
+
+    def build(self, texts, embedding_model, collection, fingerprint=None):
+        from numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore.from_documents(texts, embedding_model)
+
+    def estimate_bytes(self, store, texts, collection):
+        return store.nbytes
+
+    def export(self, store, collection):
+        return store.export()
+
+    def restore(self, data, embedding_model, collection):
+        from numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(
+            embedding_model, vectors=data["embeddings"], texts=data["documents"],
+            metadatas=data["metadatas"], ids=data["ids"]
+        )
+
+    def delete(self, collection):
+        # Nothing outside the store object; dropping it frees the memory
+        pass
+
+class MappedBackend:
+    """Read-only index files per document, memory-mapped and shared by every session and process"""
+    name = "mapped"
+
+    def build(self, texts, embedding_model, collection, fingerprint=None):
+        from mapped_index import MappedVectorStore
+        return MappedVectorStore(embedding_model, self.open_or_write(texts, embedding_model, fingerprint))
+
+    def open_or_write(self, texts, embedding_model, fingerprint):
+        """Open the document's index files, embedding and writing them first if missing"""
+        from mapped_index import index_path, index_exists, write_index, open_index, embedding_model_name
+        if fingerprint is None:
+            raise ValueError("Mapped indexes are keyed by document fingerprint")
+        path = index_path(fingerprint, embedding_model)
+        if index_exists(path):
+            metrics.increment("vector.mapped_reuse")
+            debug_log(f"Reusing index files {os.path.basename(path)}")
+        else:
+            contents = [doc.page_content for doc in texts]
+            vectors = embedding_model.embed_documents(contents)
+            write_index(path, contents, [doc.metadata for doc in texts], vectors, embedding_model_name(embedding_model))
+        return open_index(path)
+
+    def estimate_bytes(self, store, texts, collection):
+        return store.nbytes
+
+    def export(self, store, collection):
+        return store.export()
+
+    def restore(self, data, embedding_model, collection):
+        from mapped_index import open_index, MappedVectorStore
+        return MappedVectorStore(embedding_model, open_index(data["path"]))
+
+    def delete(self, collection):
+        # The files are a cache shared with other sessions and processes
+        pass
+
+class HnswBackend(MappedBackend):
+    """Mapped index files plus a persisted HNSW graph (hnswlib) for approximate search"""
+    name = "hnsw"
+
+    def build(self, texts, embedding_model, collection, fingerprint=None):
+        from ann_index import HnswVectorStore, open_graph
+        index = self.open_or_write(texts, embedding_model, fingerprint)
+        return HnswVectorStore(embedding_model, index, open_graph(index))
+
+    def restore(self, data, embedding_model, collection):
+        from mapped_index import open_index
+        from ann_index import HnswVectorStore, open_graph
+        index = open_index(data["path"])
+        return HnswVectorStore(embedding_model, index, open_graph(index), ef_search=data["ef_search"])
+
+BACKENDS = {backend.name: backend for backend in (MappedBackend(), NumpyBackend(), HnswBackend(), ChromaBackend())}
+
+def choose_backend(chunk_count):
+    """Shared mapped files for single documents, an ANN graph (or Chroma) for large corpora"""
+    if VECTOR_BACKEND in BACKENDS:
+        return BACKENDS[VECTOR_BACKEND]
+    if chunk_count <= NUMPY_MAX_CHUNKS:
+        return BACKENDS["mapped"]
+    from ann_index import ann_available
+    return BACKENDS["hnsw"] if ann_available() else BACKENDS["chroma"]
+
+def _spill_path(name):
+    return os.path.join(private_dir(SPILL_DIR, "chatbot_index_spill-"), name)
+
+def _write_spill(name, data):
+    """Vectors as a .npy array, everything else as JSON (never pickle: the files are loaded back into the server)"""
+    path = _spill_path(name)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    data = dict(data)
+    vectors = data.pop("embeddings", None)
+    if vectors is not None:
+        np.save(os.path.join(path, "embeddings.npy"), np.asarray(vectors, dtype=np.float32), allow_pickle=False)
+    with open(os.path.join(path, "data.json"), "w", encoding="utf-8") as data_file:
+        json.dump(data, data_file)
+
+def _read_spill(name):
+    path = _spill_path(name)
+    with open(os.path.join(path, "data.json"), encoding="utf-8") as data_file:
+        data = json.load(data_file)
+    vectors_path = os.path.join(path, "embeddings.npy")
+    if os.path.exists(vectors_path):
+        data["embeddings"] = np.load(vectors_path, allow_pickle=False)
+    elif "documents" in data:
+        data["embeddings"] = None
+    return data
+
+def _remove_spill(name):
+    shutil.rmtree(_spill_path(name), ignore_errors=True)
+
+def _update_gauges():
+    in_memory = [entry for entry in _LIVE_COLLECTIONS.values() if not entry["evicted"]]
+    metrics.set_gauge("vector.collections", len(in_memory))
+    metrics.set_gauge("vector.collection_bytes", sum(entry["bytes"] for entry in in_memory))
+    metrics.set_gauge("vector.evicted_collections", len(_LIVE_COLLECTIONS) - len(in_memory))
+
+def _delete_collection(name, backend):
+    """Drop a collection from its backend and from disk (safe to call twice)"""
+    with _registry_lock:
+        entry = _LIVE_COLLECTIONS.pop(name, None)
+        _update_gauges()
+    backend.delete(name)
+    _remove_spill(name)
+    if entry:
+        debug_log(f"Deleted collection {name} ({entry['chunks']} chunks, ~{entry['bytes'] // 1024} KiB)")
+
+class CollectionHandle:
+    """Owns one collection; deleting the handle (or the session holding it) deletes the collection"""
+
+    def __init__(self, name, store, embedding_model, backend, fingerprint=None):
+        self.name = name
+        self.store = store
+        self.embedding_model = embedding_model
+        self.backend = backend
+        self.fingerprint = fingerprint
+        self.summary_tree = None  # loaded on first use, dropped with the store
+        self.last_used = time.monotonic()
+        self.pins = 0  # chat turns using the store right now; a pinned collection is never evicted
+        self._chains = weakref.WeakSet()  # RAG chains searching this store
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, _delete_collection, name, backend)
+
+    @property
+    def evicted(self):
+        return self.store is None
+
+    def pin(self):
+        with self._lock:
+            self.pins += 1
+
+    def unpin(self):
+        with self._lock:
+            self.pins -= 1
+            self.last_used = time.monotonic()
+
+    def attach_chain(self, chain):
+        """Point a RAG chain at this collection; eviction detaches it so the store can be freed"""
+        chain.use_store(self.store)
+        self._chains.add(chain)
+
+    def _detach_chains(self):
+        for chain in list(self._chains):
+            chain.use_store(None)
+
+    def summary(self):
+        """The document's section summary tree (from disk on first use), or None if not built yet"""
+        if self.summary_tree is None and self.fingerprint:
+            from section_summaries import load_summary_tree
+            self.summary_tree = load_summary_tree(self.fingerprint)
+        return self.summary_tree
+
+    def release(self):
+        self.store = None
+        self.summary_tree = None
+        self._detach_chains()
+        self._finalizer()
+
+    def evict(self):
+        """Write the collection to disk and drop it from memory; returns the bytes freed"""
+        with self._lock:
+            if self.store is None or not self._finalizer.alive or self.pins:
+                return 0
+            _write_spill(self.name, self.backend.export(self.store, self.name))
+            self.backend.delete(self.name)
+            self.store = None
+            self.summary_tree = None  # stored with the document index; reloaded on the next broad question
+            # The handle must hold the only reference, or nothing is freed (ensure_session_index reattaches)
+            self._detach_chains()
+
+            with _registry_lock:
+                entry = _LIVE_COLLECTIONS.get(self.name, {"bytes": 0})
+                entry["evicted"] = True
+                _update_gauges()
+        metrics.increment("vector.evictions")
+        debug_log(f"Evicted collection {self.name} to disk (~{entry['bytes'] // 1024} KiB)")
+        return entry["bytes"]
+
+    def ensure_loaded(self):
+        """Return the vector store, restoring it from disk first if it was evicted"""
+        with self._lock:
+            self.last_used = time.monotonic()
+            if self.store is not None or not self._finalizer.alive:
+                return self.store
+
+            started = time.perf_counter()
+            store = self.backend.restore(_read_spill(self.name), self.embedding_model, self.name)
+            _remove_spill(self.name)
+            self.store = store
+
+            with _registry_lock:
+                if self.name in _LIVE_COLLECTIONS:
+                    _LIVE_COLLECTIONS[self.name]["evicted"] = False
+                _update_gauges()
+        metrics.increment("vector.reloads")
+        metrics.observe("vector.reload", time.perf_counter() - started)
+        debug_log(f"Reloaded collection {self.name} from disk ({len(store)} chunks)")
+        return store
+
+def create_collection(texts, embedding_model, name, backend=None, fingerprint=None):
+    """Build a named collection from chunks, replacing any collection of the same name"""
+    backend = backend or choose_backend(len(texts))
+    for existing in BACKENDS.values():
+        _delete_collection(name, existing)
+    started = time.perf_counter()
+    store = backend.build(texts, embedding_model, name, fingerprint)
+    metrics.observe("vector.build", time.perf_counter() - started, backend=backend.name)
+
+    with _registry_lock:
+        _LIVE_COLLECTIONS[name] = {
+            "backend": backend.name,
+            "chunks": len(texts),
+            "bytes": backend.estimate_bytes(store, texts, name),
+            "evicted": False,
+        }
+        _update_gauges()
+    debug_log(f"Created {backend.name} collection {name} with {len(texts)} chunks")
+    return CollectionHandle(name, store, embedding_model, backend, fingerprint)
+
+def attach_collection(name, backend_name, data, embedding_model, fingerprint=None):
+    """Open an existing on-disk index (e.g. a pre-built course) as a session collection"""
+    backend = BACKENDS[backend_name]
+    for existing in BACKENDS.values():
+        _delete_collection(name, existing)
+    store = backend.restore(data, embedding_model, name)
+
+    with _registry_lock:
+        _LIVE_COLLECTIONS[name] = {
+            "backend": backend.name,
+            "chunks": len(store),
+            "bytes": store.nbytes,
+            "evicted": False,
+        }
+        _update_gauges()
+    debug_log(f"Attached {backend.name} collection {name} ({len(store)} chunks)")
+    return CollectionHandle(name, store, embedding_model, backend, fingerprint)
+
+def live_collections():
+    """Name -> {backend, chunks, bytes, evicted} for every collection still held by a session"""
+    with _registry_lock:
+        return {name: dict(entry) for name, entry in _LIVE_COLLECTIONS.items()}
+
+def session_key():
+    """Random per-session key used in collection names"""
+    if not st.session_state.get("session_key"):
+        import uuid
+        st.session_state.session_key = uuid.uuid4().hex
+    return st.session_state.session_key
+
+def release_session_collection():
+    """Delete the current session's collection, if it has one"""
+    handle = st.session_state.get("collection_handle")
+    if handle is not None:
+        handle.release()
+    st.session_state.collection_handle = None
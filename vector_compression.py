@@ -0,0 +1,83 @@
+"""
+vector_compression.py - Optional PCA projection and float16/int8 scalar quantization of embeddings
+"""
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+# Rows upcast to float32 at once when scoring compressed vectors
+SCORE_BLOCK_ROWS = 4096
+
+def normalize_rows(vectors):
+    """Unit-length float32 rows (zero rows stay zero)"""
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class VectorCodec:
+    """Encodes unit vectors for storage and scores queries against the encoded rows.
+
+    PCA (learned per document) drops dimensions; float16 halves each value and
+    int8 stores each dimension as a signed byte with a per-dimension scale.
+    """
+
+    def __init__(self, precision="float32", pca_dimensions=0):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown vector precision '{precision}', expected one of {PRECISIONS}")
+        self.precision = precision
+        self.pca_dimensions = pca_dimensions
+        self.mean = None
+        self.components = None
+        self.scale = None
+
+    @property
+    def lossless(self):
+        return self.precision == "float32" and self.components is None
+
+    @property
+    def nbytes(self):
+        """Memory held by the codec parameters"""
+        return sum(array.nbytes for array in (self.mean, self.components, self.scale) if array is not None)
+
+    def fit(self, matrix):
+        """Learn the projection and quantization scales from a document's vectors"""
+        self.mean = self.components = self.scale = None
+        if 0 < self.pca_dimensions < matrix.shape[1] and len(matrix) > self.pca_dimensions:
+            self.mean = matrix.mean(axis=0)
+            _, _, vt = np.linalg.svd(matrix - self.mean, full_matrices=False)
+            self.components = np.ascontiguousarray(vt[:self.pca_dimensions].T, dtype=np.float32)
+        if self.precision == "int8":
+            scale = np.abs(self.project(matrix)).max(axis=0) / 127.0
+            scale[scale == 0] = 1.0
+            self.scale = scale.astype(np.float32)
+        return self
+
+    def project(self, matrix):
+        """Apply the PCA projection (if any) and renormalize"""
+        if self.components is None:
+            return matrix
+        return normalize_rows((matrix - self.mean) @ self.components)
+
+    def encode(self, matrix):
+        projected = self.project(matrix)
+        if self.precision == "float16":
+            return projected.astype(np.float16)
+        if self.precision == "int8":
+            return np.clip(np.round(projected / self.scale), -127, 127).astype(np.int8)
+        return np.ascontiguousarray(projected, dtype=np.float32)
+
+    def scores(self, encoded, query_vector):
+        """Approximate cosine similarity of a unit query vector to every encoded row"""
+        query = self.project(query_vector.reshape(1, -1))[0]
+        if self.precision == "int8":
+            # Folding the scale into the query dequantizes the dot product
+            query = query * self.scale
+        if encoded.dtype == np.float32:
+            return encoded @ query
+        scores = np.empty(len(encoded), dtype=np.float32)
+        for start in range(0, len(encoded), SCORE_BLOCK_ROWS):
+            block = encoded[start:start + SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
@@ -0,0 +1,92 @@
+"""
+working_set.py - Per-conversation working set of recently retrieved chunks for follow-up questions
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+import metrics
+from session_manager import debug_log
+
+# Chunks kept per conversation (oldest are dropped first)
+MAX_WORKING_SET_CHUNKS = 24
+# A query this close to some chunk in the working set counts as a follow-up
+FOLLOWUP_SIMILARITY = 0.6
+# Working-set chunks reused for a follow-up
+FOLLOWUP_CHUNKS = 4
+# Fresh chunks fetched from the vector store on top of the working set
+INCREMENTAL_K = 2
+
+def _chunk_key(doc):
+    metadata = doc.metadata
+    return (metadata.get("source", ""), metadata.get("page", -1), metadata.get("start_index", -1), doc.page_content)
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class WorkingSet:
+    """Recently retrieved chunks of one conversation, with their normalized embeddings.
+
+    Retrieval runs on a deadline executor thread while the script thread may
+    read the set, so every access to the entries holds the lock.
+    """
+
+    def __init__(self, max_chunks=MAX_WORKING_SET_CHUNKS):
+        self.max_chunks = max_chunks
+        self._entries = OrderedDict()  # chunk key -> (doc, vector)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """Memory held by the chunk vectors"""
+        with self._lock:
+            return sum(vector.nbytes for _, vector in self._entries.values())
+
+    def add(self, docs, db):
+        """Add retrieved chunks, reusing the store's vectors (embedding only if it cannot return them)"""
+        with self._lock:
+            new_docs = [doc for doc in docs if _chunk_key(doc) not in self._entries]
+        vectors = None
+        if new_docs and hasattr(db, "vectors_for"):
+            vectors = db.vectors_for(new_docs)
+        if new_docs and vectors is None:
+            vectors = db.embeddings.embed_documents([doc.page_content for doc in new_docs])
+            metrics.increment("working_set.embedded", len(new_docs))
+        with self._lock:
+            for doc, vector in zip(new_docs, vectors if new_docs else ()):
+                self._entries[_chunk_key(doc)] = (doc, _normalize(vector))
+            for doc in docs:
+                key = _chunk_key(doc)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            while len(self._entries) > self.max_chunks:
+                self._entries.popitem(last=False)
+
+    def rank(self, query_vector):
+        """Working-set chunks as (doc, similarity), best first"""
+        with self._lock:
+            if not self._entries:
+                return []
+            docs = [doc for doc, _ in self._entries.values()]
+            matrix = np.stack([vector for _, vector in self._entries.values()])
+        scores = matrix @ _normalize(query_vector)
+        order = np.argsort(-scores)
+        return [(docs[i], float(scores[i])) for i in order]
+
+    def follow_up(self, db, query_vector):
+        """Chunks for a follow-up question, or None if the query drifted away from the working set"""
+        ranked = self.rank(query_vector)
+        if not ranked or ranked[0][1] < FOLLOWUP_SIMILARITY:
+            return None
+        reused = [doc for doc, score in ranked[:FOLLOWUP_CHUNKS] if score >= FOLLOWUP_SIMILARITY / 2]
+        fresh = db.similarity_search_by_vector(list(map(float, query_vector)), k=INCREMENTAL_K)
+        seen = {_chunk_key(doc) for doc in reused}
+        chunks = reused + [doc for doc in fresh if _chunk_key(doc) not in seen]
+        metrics.increment("working_set.followups")
+        debug_log(f"Working set follow-up: reused {len(reused)} chunks (best {ranked[0][1]:.2f}), {len(chunks) - len(reused)} new")
+        return chunks
@@ -0,0 +1,90 @@
+"""
+write_behind.py - Conversation saves written in the background, coalesced per conversation and committed in batches
+"""
+import atexit
+import os
+import threading
+import time
+import metrics
+from session_manager import debug_log
+from database_manager import save_conversation, save_conversations
+
+# How long the writer waits for more saves to gather before committing
+WRITE_BEHIND_DELAY_SECONDS = float(os.getenv("WRITE_BEHIND_DELAY_SECONDS", "0.5"))
+# Most conversations written in one transaction
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "64"))
+
+_condition = threading.Condition()
+_PENDING = {}  # conversation_id -> save_conversation kwargs; a newer save replaces the queued one
+# Held while a batch is taken and written, so saves of one conversation reach the database in order
+_write_lock = threading.Lock()
+_writer = None
+
+def enqueue_save(username, conversation_id, title, messages, document_name=None, edited=None):
+    """Queue a conversation save and return immediately"""
+    save = {
+        "username": username,
+        "conversation_id": conversation_id,
+        "title": title,
+        "messages": [dict(message) for message in messages],  # session state keeps changing
+        "document_name": document_name,
+        "edited": sorted(edited) if edited else None,
+    }
+    with _condition:
+        queued = _PENDING.get(conversation_id)
+        if queued is not None:
+            metrics.increment("persistence.coalesced")
+            # Indexes edited in the replaced snapshot still need rewriting
+            if queued["edited"]:
+                save["edited"] = sorted(set(queued["edited"]) | set(save["edited"] or ()))
+        _PENDING[conversation_id] = save
+        metrics.increment("persistence.saves")
+        metrics.set_gauge("persistence.queue_depth", len(_PENDING))
+        _start_writer()
+        _condition.notify()
+
+def _start_writer():
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        _writer = threading.Thread(target=_run, name="write-behind", daemon=True)
+        _writer.start()
+
+def _take(limit=None):
+    with _condition:
+        conversation_ids = list(_PENDING)[:limit]
+        batch = [_PENDING.pop(conversation_id) for conversation_id in conversation_ids]
+        metrics.set_gauge("persistence.queue_depth", len(_PENDING))
+        return batch
+
+def _write(batch):
+    if not batch:
+        return
+    started = time.monotonic()
+    if not save_conversations(batch):
+        # Save one at a time so a single bad conversation does not lose the others
+        for save in batch:
+            if save_conversation(**save) is None:
+                metrics.increment("persistence.failed")
+                debug_log(f"Could not save conversation {save['conversation_id']}")
+    metrics.increment("persistence.batches")
+    metrics.observe("persistence.commit", time.monotonic() - started)
+
+def _run():
+    while True:
+        with _condition:
+            while not _PENDING:
+                _condition.wait()
+        # Let saves from other sessions (and newer saves of the same conversation) gather
+        time.sleep(WRITE_BEHIND_DELAY_SECONDS)
+        with _write_lock:
+            _write(_take(WRITE_BEHIND_MAX_BATCH))
+
+def flush_saves():
+    """Write every queued save now, in the calling thread (before reads that must see them, logout and exit)"""
+    with _write_lock:
+        batch = _take()
+        _write(batch)
+    if batch:
+        debug_log(f"Flushed {len(batch)} queued conversation saves")
+
+atexit.register(flush_saves)